@@ -1,9 +1,52 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import bisect
+import collections
+import hashlib
+import json
+import os
 import re
+import tempfile
+import time
 import traceback
 
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.utils.display import Display
+
+display = Display()
+
+# Set SDAF_ERROR_CODE_TRACE=1 to record every rule evaluation: which rule
+# was evaluated, whether it matched and how long it took. The records are
+# kept in error_code_trace and written to the Ansible output.
+TRACE_EVALUATIONS = os.environ.get("SDAF_ERROR_CODE_TRACE", "").lower() in ("1", "true", "yes")
+error_code_trace = collections.deque(maxlen=1000)
+
+
+# Writes a debug message when Ansible runs with at least the given
+# verbosity. The message is only formatted in that case, so pass a
+# %-style format and its arguments rather than an f-string.
+def debug(verbosity, message, *args):
+    if display.verbosity >= verbosity:
+        display.verbose(message % args if args else message, caplevel=verbosity - 1)
+
+
+# Records an evaluation of rule that started at the given
+# time.perf_counter() value, see TRACE_EVALUATIONS.
+def trace_evaluation(rule, matched, started):
+    elapsed = time.perf_counter() - started
+    error_code_trace.append((rule.code, matched, elapsed))
+    display.display(f"error code rule {rule.code} "+
+        f"{'matched' if matched else 'did not match'} in {elapsed * 1000:.3f}ms")
+
 # List of 3 elm tuples of the format (regex, msg, valid_tags). regex
 # is used to find if a stderr message contains a certain substring.
 # msg is the error coded message to return in case a match is found
@@ -11,6 +54,8 @@ import traceback
 # are all present in the list of valid tags listed in the 3rd item
 # of the tuple (valid_tags). Tags are used to capture the context in
 # which the filter had been called.
+# This built-in catalogue is only used when the catalogue file (see
+# CATALOGUE_PATH) cannot be loaded.
 regex_to_error_msgs = [
     (r'(.*)A secret with(.*)-sid-sshkey was not found in this key vault. If you recently deleted this secret you may be able to recover it using the correct recovery command.(.*)',
         'INSTALL:0015:Secret <SID>-sid-sshkey not found in key vault.',
@@ -41,11 +86,736 @@ regex_to_error_msgs = [
         {'task_tag=pasinstall', 'failure=db_offline'})
 ]
 
+# Versioned YAML or JSON catalogue with the same entries as
+# regex_to_error_msgs, see vars/error_code_catalogue.yaml for the format.
+# Can be overridden with the SDAF_ERROR_CODE_CATALOGUE environment
+# variable.
+CATALOGUE_PATH = os.environ.get(
+    "SDAF_ERROR_CODE_CATALOGUE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 "..", "vars", "error_code_catalogue.yaml"))
+CATALOGUE_VERSIONS = (1,)
+
+# Compiled catalogues are cached in this directory, keyed by the hash of
+# the catalogue file, so forked workers skip parsing and analysing it.
+# Bump CACHE_FORMAT whenever the compiled form of a rule, or the rules
+# that are accepted, change.
+CACHE_DIRECTORY = os.path.expanduser(
+    os.environ.get("ANSIBLE_LOCAL_TEMP", os.path.join("~", ".ansible", "tmp")))
+CACHE_FORMAT = 2
+
+# Maximum length of the matched excerpt reported for each error code
+EXCERPT_LENGTH = 200
+
+# Number of classification results kept by classification_cache
+CLASSIFICATION_CACHE_SIZE = 256
+
+# Opcodes of repeats that are unbounded when their max is MAXREPEAT
+_REPEAT_OPCODES = tuple(
+    getattr(sre_constants, name)
+    for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+    if hasattr(sre_constants, name))
+
+# Pairs of complementary categories; a character class containing
+# both halves of a pair matches every character (e.g. [\s\d\w\D\W])
+_COMPLEMENTARY_CATEGORIES = [
+    (sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_NOT_DIGIT),
+    (sre_constants.CATEGORY_WORD, sre_constants.CATEGORY_NOT_WORD),
+    (sre_constants.CATEGORY_SPACE, sre_constants.CATEGORY_NOT_SPACE),
+]
+
+# Returns the sub patterns nested inside a parsed regex item
+def _get_nested_patterns(opcode, argument):
+    if opcode in _REPEAT_OPCODES:
+        return [argument[2]]
+    if opcode == sre_constants.SUBPATTERN:
+        return [argument[-1]]
+    if opcode == sre_constants.BRANCH:
+        return list(argument[1])
+    if opcode in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [argument[1]]
+    if opcode == sre_constants.GROUPREF_EXISTS:
+        return [nested for nested in argument[1:] if nested is not None]
+    if opcode == getattr(sre_constants, 'ATOMIC_GROUP', None):
+        return [argument]
+    return []
+
+
+def _is_unbounded_repeat(opcode, argument):
+    return opcode in _REPEAT_OPCODES and argument[1] == sre_constants.MAXREPEAT
+
+
+def _find_nested_unbounded_repeat(parsed, inside_unbounded=False):
+    for (opcode, argument) in parsed:
+        unbounded = _is_unbounded_repeat(opcode, argument)
+        if unbounded and inside_unbounded:
+            return True
+        for nested in _get_nested_patterns(opcode, argument):
+            if _find_nested_unbounded_repeat(nested, inside_unbounded or unbounded):
+                return True
+    return False
+
+
+# Rejects catalogue patterns that can backtrack exponentially, i.e.
+# patterns with an unbounded quantifier nested inside another one
+# such as (a+)+ or (.*)*. Raises ValueError for such patterns.
+def validate_pattern(pattern):
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as ex:
+        raise ValueError(f"invalid pattern {pattern!r}: {ex}")
+    if _find_nested_unbounded_repeat(parsed):
+        raise ValueError(
+            f"pattern {pattern!r} nests unbounded quantifiers and can backtrack "
+            "exponentially")
+
+
+def _count_unbounded_repeats(parsed):
+    count = 0
+    for (opcode, argument) in parsed:
+        if _is_unbounded_repeat(opcode, argument):
+            count += 1
+        for nested in _get_nested_patterns(opcode, argument):
+            count += _count_unbounded_repeats(nested)
+    return count
+
+
+# Rejects patterns evaluated with re.match, i.e. without a search plan
+# (see get_search_plan), that have more than one unbounded quantifier.
+# Adjacent ones such as (.*)A(.*)B(.*)C$ backtrack polynomially over the
+# ways of splitting the message between them, while with at most one
+# re.match runs in linear time. Raises ValueError for such patterns.
+def validate_match_pattern(pattern):
+    if _count_unbounded_repeats(sre_parse.parse(pattern)) > 1:
+        raise ValueError(
+            f"pattern {pattern!r} is not fixed text separated by wildcards and has "
+            "more than one unbounded quantifier, so it can backtrack polynomially")
+
+
+# Returns the error code an error coded message starts with,
+# e.g. INSTALL:0020 for 'INSTALL:0020:DB Load failure, ...'
+def get_error_code(op_message):
+    return ":".join(op_message.split(":")[:2])
+
+
+# Returns the literal substrings that every match of the regex must
+# contain, i.e. the runs of plain characters at the top level of the
+# pattern. Patterns that are case insensitive yield no literals since
+# a plain substring check would not be equivalent.
+def get_required_literals(pattern):
+    parsed = sre_parse.parse(pattern)
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    if state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return []
+    literals = []
+    current = []
+    for (opcode, argument) in parsed:
+        if opcode == sre_constants.LITERAL:
+            current.append(chr(argument))
+            continue
+        if current:
+            literals.append("".join(current))
+            current = []
+    if current:
+        literals.append("".join(current))
+    return literals
+
+
+# Returns 'all' if the parsed item is a wildcard matching any text,
+# 'line' if it matches any text without a newline, or None otherwise.
+# Wildcards are .* and [\s\d\w\D\W]*, optionally inside a group.
+def _get_wildcard_kind(opcode, argument, dotall):
+    if opcode == sre_constants.SUBPATTERN:
+        (add_flags, del_flags, nested) = argument[-3:]
+        if add_flags or del_flags or len(nested) != 1:
+            return None
+        return _get_wildcard_kind(nested[0][0], nested[0][1], dotall)
+    if opcode not in _REPEAT_OPCODES or argument[0] != 0 \
+            or argument[1] != sre_constants.MAXREPEAT or len(argument[2]) != 1:
+        return None
+    (item_opcode, item_argument) = argument[2][0]
+    if item_opcode == sre_constants.ANY:
+        return 'all' if dotall else 'line'
+    if item_opcode == sre_constants.IN:
+        categories = {value for (kind, value) in item_argument
+                      if kind == sre_constants.CATEGORY}
+        for (category, complement) in _COMPLEMENTARY_CATEGORIES:
+            if category in categories and complement in categories:
+                return 'all'
+    return None
+
+
+# Builds a linear time search plan for patterns that consist of fixed
+# text separated by wildcards, e.g. (.*)Connect to(.*)started(.*).
+# re.match on such a pattern succeeds if and only if the pieces of
+# fixed text occur in order, so each piece is searched for from the end
+# of the previous one instead of letting the regex engine backtrack
+# over every way of splitting the message between the wildcards.
+# Returns (anchored, dotall, segments) where segments is a list of
+# (literal, regex, width) tuples, only one of literal and regex being
+# set, or None if the pattern has some other shape.
+def get_search_plan(pattern):
+    parsed = sre_parse.parse(pattern)
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    if state.flags & ~(sre_constants.SRE_FLAG_UNICODE | sre_constants.SRE_FLAG_DOTALL):
+        return None
+    dotall = bool(state.flags & sre_constants.SRE_FLAG_DOTALL)
+    kinds = set()
+    pieces = [[]]
+    for (opcode, argument) in parsed:
+        kind = _get_wildcard_kind(opcode, argument, dotall)
+        if kind:
+            kinds.add(kind)
+            if pieces[-1]:
+                pieces.append([])
+        elif opcode in (sre_constants.LITERAL, sre_constants.ANY):
+            pieces[-1].append((opcode, argument))
+        else:
+            return None
+    if len(kinds) > 1:
+        return None
+    within_line = kinds == {'line'}
+    anchored = _get_wildcard_kind(*parsed[0], dotall) is None if len(parsed) else True
+    segments = []
+    for piece in pieces:
+        if not piece:
+            continue
+        if within_line and (sre_constants.LITERAL, ord("\n")) in piece:
+            return None
+        if all(opcode == sre_constants.LITERAL for (opcode, _) in piece):
+            literal = "".join(chr(argument) for (_, argument) in piece)
+            segments.append((literal, None, len(literal)))
+        else:
+            regex = "".join(re.escape(chr(argument)) if opcode == sre_constants.LITERAL
+                            else "." for (opcode, argument) in piece)
+            segments.append(
+                (None, re.compile(regex, re.DOTALL if dotall else 0), len(piece)))
+    return (anchored, not within_line, segments)
+
+
+class ErrorCodeRule(object):
+    """
+    A single compiled catalogue entry. Patterns made of fixed text and
+    wildcards are evaluated with the search plan from get_search_plan,
+    which runs in linear time. Any other pattern is evaluated with
+    re.match and must pass validate_match_pattern as well.
+    """
+
+    def __init__(self, pattern, op_message, valid_tags):
+        validate_pattern(pattern)
+        self.plan = get_search_plan(pattern)
+        if self.plan is None:
+            validate_match_pattern(pattern)
+        self.pattern = pattern
+        self.op_message = op_message
+        self.code = get_error_code(op_message)
+        self.valid_tags = set(valid_tags or ())
+        self.literals = tuple(get_required_literals(pattern))
+        self.regex = re.compile(pattern) if self.plan is None else None
+
+    def to_dict(self):
+        """
+        Returns the compiled rule in a JSON serializable form.
+        """
+        plan = None
+        if self.plan is not None:
+            (anchored, dotall, segments) = self.plan
+            plan = [anchored, dotall,
+                    [[literal, regex.pattern if regex else None, width]
+                     for (literal, regex, width) in segments]]
+        return {
+            "pattern": self.pattern,
+            "op_message": self.op_message,
+            "valid_tags": sorted(self.valid_tags),
+            "literals": list(self.literals),
+            "plan": plan,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds a rule returned by to_dict without analysing the pattern
+        again.
+        """
+        rule = cls.__new__(cls)
+        rule.pattern = data["pattern"]
+        rule.op_message = data["op_message"]
+        rule.code = get_error_code(rule.op_message)
+        rule.valid_tags = set(data["valid_tags"])
+        rule.literals = tuple(data["literals"])
+        rule.plan = None
+        rule.regex = None
+        if data["plan"] is None:
+            rule.regex = re.compile(rule.pattern)
+        else:
+            (anchored, dotall, segments) = data["plan"]
+            flags = re.DOTALL if dotall else 0
+            rule.plan = (anchored, dotall, [
+                (literal, re.compile(regex, flags) if regex is not None else None, width)
+                for (literal, regex, width) in segments])
+        return rule
+
+    def search(self, message):
+        """
+        Returns the (start, end) span of the fixed text matched in the
+        message, or None if the rule does not match.
+        """
+        if self.plan is None:
+            match = self.regex.match(message)
+            return match.span() if match else None
+        (anchored, dotall, segments) = self.plan
+        endpos = len(message)
+        if not dotall:
+            newline = message.find("\n")
+            if newline != -1:
+                endpos = newline
+        pos = 0
+        start = None
+        for (literal, regex, _) in segments:
+            if literal is not None:
+                if anchored and start is None:
+                    found = 0 if message.startswith(literal, 0, endpos) else -1
+                else:
+                    found = message.find(literal, pos, endpos)
+                if found == -1:
+                    return None
+                end = found + len(literal)
+            else:
+                if anchored and start is None:
+                    match = regex.match(message, 0, endpos)
+                else:
+                    match = regex.search(message, pos, endpos)
+                if not match:
+                    return None
+                (found, end) = match.span()
+            if start is None:
+                start = found
+            pos = end
+        return (start or 0, pos)
+
+    def advance(self, state, buffer, base, newline, final):
+        """
+        Continues a streaming search of the rule over buffer, the part of
+        the stream that starts at offset base. state is the list
+        [segment index, offset to search from, match start] carried
+        between calls, and newline is the offset of the first newline in
+        the stream or -1 if none was seen yet. Returns True once the rule
+        matched, False once it can no longer match and None if more of
+        the stream is needed. Rules without a search plan are evaluated
+        against the first buffer only.
+        """
+        if self.plan is None:
+            return self.search(buffer) is not None
+        (anchored, dotall, segments) = self.plan
+        end_of_input = final
+        limit = base + len(buffer)
+        if not dotall and newline != -1:
+            # the match has to end before the first newline, so the whole
+            # range it can occur in has been seen already
+            limit = min(limit, newline)
+            end_of_input = True
+        while state[0] < len(segments):
+            (literal, regex, width) = segments[state[0]]
+            if anchored and state[0] == 0:
+                if base != 0:
+                    return False
+                if limit < width and not end_of_input:
+                    return None
+                if literal is not None:
+                    found = 0 if buffer.startswith(literal, 0, limit) else -1
+                else:
+                    match = regex.match(buffer, 0, limit)
+                    found = 0 if match else -1
+            else:
+                start = max(state[1] - base, 0)
+                if literal is not None:
+                    found = buffer.find(literal, start, limit - base)
+                else:
+                    match = regex.search(buffer, start, limit - base)
+                    found = match.start() if match else -1
+            if found == -1:
+                return False if end_of_input else None
+            if state[2] is None:
+                state[2] = base + found
+            state[1] = base + found + width
+            state[0] += 1
+        return True
+
+
+class ErrorCodeMatcher(object):
+    """
+    Compiled form of an error code catalogue, built from a list of
+    ErrorCodeRule (see compile_catalogue). The rules are indexed by their
+    valid tags, so a call only looks at the rules that accept its tag
+    list. The literal substrings those rules require are collected, so a
+    single prefilter stage over the message decides which of them can
+    match at all. Only those candidates are then evaluated, in catalogue
+    order.
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        # rules without valid tags apply to every tag list
+        self.untagged_rules = set()
+        # maps each tag to the rules that list it as a valid tag
+        self.tag_index = {}
+        # tag list -> (rules, literals) of the rules accepting it
+        self.rules_by_tags = {}
+        for rule in rules:
+            index = len(self.rules)
+            self.rules.append(rule)
+            if not rule.valid_tags:
+                self.untagged_rules.add(index)
+            for tag in rule.valid_tags:
+                self.tag_index.setdefault(tag, set()).add(index)
+
+    def get_rules(self, tag_list):
+        """
+        Returns the rules, in catalogue order, that accept the tag list,
+        i.e. whose valid tags include all of the tags or are empty,
+        together with the distinct literals those rules require.
+        """
+        key = frozenset(tag_list)
+        if key not in self.rules_by_tags:
+            if key:
+                indices = set.intersection(
+                    *[self.tag_index.get(tag, set()) for tag in key])
+                indices |= self.untagged_rules
+            else:
+                indices = range(len(self.rules))
+            rules = [self.rules[index] for index in sorted(indices)]
+            literals = []
+            for rule in rules:
+                for literal in rule.literals:
+                    if literal not in literals:
+                        literals.append(literal)
+            self.rules_by_tags[key] = (rules, literals)
+        return self.rules_by_tags[key]
+
+    def candidates(self, message, tag_list):
+        """
+        Returns the rules, in catalogue order, that accept the tag list
+        and whose required literals are all present in the message.
+        """
+        (rules, literals) = self.get_rules(tag_list)
+        present = {literal for literal in literals if literal in message}
+        return [rule for rule in rules
+                if all(literal in present for literal in rule.literals)]
+
+    def match(self, message, tag_list):
+        """
+        Returns the error coded message of the first rule that matches the
+        message and accepts the tag list, or None if there is no such rule.
+        """
+        return self.evaluate(message, self.candidates(message, tag_list))
+
+    def evaluate(self, message, rules):
+        """
+        Returns the error coded message of the first of the rules that
+        matches the message, or None if none of them does.
+        """
+        for rule in rules:
+            started = time.perf_counter() if TRACE_EVALUATIONS else None
+            span = rule.search(message)
+            if started is not None:
+                trace_evaluation(rule, span is not None, started)
+            if span is not None:
+                debug(4, "rule %s matched, valid tags = %s", rule.code, rule.valid_tags)
+                return rule.op_message
+        return None
+
+    def match_all(self, message, tag_list):
+        """
+        Evaluates every rule that accepts the tag list against the message
+        and returns a list, in catalogue order, with a dict for each rule
+        that matched: its code, error coded message, the start and end
+        offsets of the fixed text matched and an excerpt of that text.
+        """
+        matches = []
+        for rule in self.candidates(message, tag_list):
+            started = time.perf_counter() if TRACE_EVALUATIONS else None
+            span = rule.search(message)
+            if started is not None:
+                trace_evaluation(rule, span is not None, started)
+            if span is None:
+                continue
+            (start, end) = span
+            matches.append({
+                "code": rule.code,
+                "message": rule.op_message,
+                "start": start,
+                "end": end,
+                "excerpt": message[start:min(end, start + EXCERPT_LENGTH)],
+            })
+        return matches
+
+    def match_batch(self, messages, tag_list, first_only=True):
+        """
+        Same as match for a list of messages, None entries being skipped.
+        The prefilter literals are searched for once in the concatenation
+        of all messages and each occurrence is mapped back to the message
+        it is in, so a rule is only evaluated against the messages that
+        contain all of its literals. Returns a list of (index, op_message)
+        for the messages that matched, in order, stopping after the first
+        one if first_only is set.
+        """
+        (rules, literals) = self.get_rules(tag_list)
+        separator = "\0"
+        indices = []
+        offsets = []
+        parts = []
+        position = 0
+        for index, message in enumerate(messages):
+            if message is None:
+                continue
+            indices.append(index)
+            offsets.append(position)
+            parts.append(message)
+            position += len(message) + len(separator)
+        text = separator.join(parts)
+        present = [set() for _ in parts]
+        for literal in literals:
+            if separator in literal:
+                for part, message in enumerate(parts):
+                    if literal in message:
+                        present[part].add(literal)
+                continue
+            found = text.find(literal)
+            while found != -1:
+                part = bisect.bisect_right(offsets, found) - 1
+                present[part].add(literal)
+                # the literal is known to be in this message, carry on
+                # from the next one
+                if part + 1 == len(parts):
+                    break
+                found = text.find(literal, offsets[part + 1])
+        matches = []
+        for part, message in enumerate(parts):
+            if not present[part] and all(rule.literals for rule in rules):
+                continue
+            op_message = self.evaluate(message, [
+                rule for rule in rules
+                if all(literal in present[part] for literal in rule.literals)])
+            # a message that already is the error coded message has not
+            # been converted
+            if op_message is not None and op_message != message:
+                matches.append((indices[part], op_message))
+                if first_only:
+                    break
+        return matches
+
+    def match_stream(self, chunks, tag_list):
+        """
+        Same as match, but for text supplied as an iterable of chunks.
+        Each rule keeps its search state between chunks and only the last
+        few characters of a chunk are carried over, enough for a piece of
+        fixed text split across two chunks to still be found, so memory
+        use does not depend on the length of the text.
+        """
+        (rules, _) = self.get_rules(tag_list)
+        overlap = max([width for rule in rules if rule.plan
+                       for (_, _, width) in rule.plan[2]] + [1]) - 1
+        states = [[0, 0, None] for _ in rules]
+        results = [None] * len(rules)
+        buffer = ""
+        base = 0
+        newline = -1
+        final = False
+        chunks = iter(chunks)
+        while not final:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+                chunk = ""
+            if newline == -1 and "\n" in chunk:
+                newline = base + len(buffer) + chunk.index("\n")
+            buffer += chunk
+            for index, rule in enumerate(rules):
+                if results[index] is None:
+                    started = time.perf_counter() if TRACE_EVALUATIONS else None
+                    results[index] = rule.advance(
+                        states[index], buffer, base, newline, final)
+                    if started is not None and results[index] is not None:
+                        trace_evaluation(rule, results[index], started)
+            # the first rule in catalogue order that can still match
+            # decides the result
+            for index, result in enumerate(results):
+                if result is None:
+                    break
+                if result:
+                    return rules[index].op_message
+            else:
+                return None
+            keep = min(overlap, len(buffer))
+            base += len(buffer) - keep
+            buffer = buffer[len(buffer) - keep:]
+        return None
+
+
+# Compiles a list of (regex, msg, valid_tags) tuples into a list of
+# ErrorCodeRule. Entries that fail validate_pattern raise ValueError,
+# unless a list is passed as errors, in which case they are skipped and
+# their error is appended to it.
+def compile_catalogue(catalogue, errors=None):
+    rules = []
+    for (matcher, op_message, valid_tags) in catalogue:
+        try:
+            rules.append(ErrorCodeRule(matcher, op_message, valid_tags))
+        except ValueError as ex:
+            if errors is None:
+                raise
+            errors.append(f"rule '{op_message}': {ex}")
+    return rules
+
+
+# Parses the content of a catalogue file, JSON if the path ends with
+# .json and YAML otherwise, into a list of (regex, msg, valid_tags)
+# tuples. Raises ValueError if it does not follow the catalogue format.
+def parse_catalogue(content, path):
+    if path.endswith(".json"):
+        data = json.loads(content)
+    else:
+        import yaml
+        data = yaml.safe_load(content)
+    if not isinstance(data, dict) or data.get("version") not in CATALOGUE_VERSIONS:
+        raise ValueError(
+            f"{path}: unsupported catalogue version, expected one of {CATALOGUE_VERSIONS}")
+    catalogue = []
+    for index, entry in enumerate(data.get("rules") or []):
+        try:
+            catalogue.append((entry["pattern"],
+                              f"{entry['code']}:{entry['message']}",
+                              set(entry.get("tags") or [])))
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError(f"{path}: rule {index} needs a code, a message and a pattern")
+    return catalogue
+
+
+def get_cache_path(digest):
+    return os.path.join(CACHE_DIRECTORY, f"sdaf_error_codes_{CACHE_FORMAT}_{digest}.json")
+
+
+# Returns the rules cached for the catalogue with the given digest, or
+# None if they have not been cached (or the cache is unreadable).
+def read_compiled_cache(digest):
+    try:
+        with open(get_cache_path(digest), "r") as cache_file:
+            data = json.load(cache_file)
+        return [ErrorCodeRule.from_dict(rule) for rule in data["rules"]]
+    except (OSError, ValueError, KeyError, TypeError, re.error):
+        return None
+
+
+# Caches the compiled rules of the catalogue with the given digest. The
+# file is written under a temporary name and renamed, so concurrent
+# workers never read a partially written cache.
+def write_compiled_cache(digest, rules):
+    temporary_path = None
+    try:
+        os.makedirs(CACHE_DIRECTORY, mode=0o700, exist_ok=True)
+        (handle, temporary_path) = tempfile.mkstemp(dir=CACHE_DIRECTORY, suffix=".tmp")
+        with os.fdopen(handle, "w") as cache_file:
+            json.dump({"rules": [rule.to_dict() for rule in rules]}, cache_file)
+        os.replace(temporary_path, get_cache_path(digest))
+    except OSError as ex:
+        debug(3, "Could not cache the compiled error code catalogue: %s", ex)
+        if temporary_path and os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+# Loads the catalogue file into an ErrorCodeMatcher, from the compiled
+# cache if the same file has been compiled before. Falls back to the
+# built-in regex_to_error_msgs if the file is missing or invalid.
+def load_error_code_matcher(path=CATALOGUE_PATH):
+    try:
+        with open(path, "rb") as catalogue_file:
+            content = catalogue_file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        rules = read_compiled_cache(digest)
+        if rules is None:
+            errors = []
+            rules = compile_catalogue(parse_catalogue(content, path), errors)
+            for error in errors:
+                display.warning(f"skipping error code catalogue {error}")
+            write_compiled_cache(digest, rules)
+        return ErrorCodeMatcher(rules)
+    except Exception as ex:
+        display.warning(f"could not load error code catalogue {path}, "+
+            f"using the built-in catalogue: {ex}")
+    return ErrorCodeMatcher(compile_catalogue(regex_to_error_msgs))
+
+
+# Compiled once when the plugin is loaded and shared by all filter calls
+error_code_matcher = load_error_code_matcher()
+
+
+class ClassificationCache(object):
+    """
+    Bounded LRU cache of classification results, keyed by a digest of the
+    message and the normalized tag set, so the same zypper or key vault
+    stderr seen across hosts and retries is only classified once per
+    worker. Hit and miss counters are shown at verbosity -vv.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind, message, tag_list):
+        """
+        Returns the cache key for a classification of the given kind
+        (e.g. first match or all matches) of message with tag_list.
+        """
+        digest = hashlib.blake2b(
+            message.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        return (kind, digest, frozenset(tag_list))
+
+    def get(self, key, compute):
+        """
+        Returns the cached result for key, calling compute() to get and
+        cache it on a miss.
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            value = self.entries[key]
+        else:
+            self.misses += 1
+            value = compute()
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        debug(2, "error code classification cache: %d hits, %d misses",
+              self.hits, self.misses)
+        return value
+
+
+classification_cache = ClassificationCache(CLASSIFICATION_CACHE_SIZE)
+
+# Keyword arguments of the filters that are options rather than tags
+FILTER_OPTIONS = ("results_key", "message_key", "return_all")
+
+# Splits the keyword arguments passed to a filter into its options
+# (see FILTER_OPTIONS) and the remaining ones, which are tags.
+def split_filter_options(kwargs):
+    options = {}
+    tags = {}
+    for key, value in kwargs.items():
+        if key in FILTER_OPTIONS:
+            options[key] = value
+        else:
+            tags[key] = value
+    return (options, tags)
+
+
 # Takes a dictionary and converts it into a set of
 # tokes of the format key=value. This set is the token list
 def convert_kwargs_to_tags(kwargs):
     if not kwargs or len(kwargs) == 0:
-        print(f"Invalid parameter kwargs={kwargs}")
+        debug(4, "Invalid parameter kwargs=%s", kwargs)
         return set()
     try:
         tokens = set()
@@ -55,8 +825,8 @@ def convert_kwargs_to_tags(kwargs):
         return tokens
     except Exception as ex:
         # return empty set in case anything goes wrong
-        print(f"encountered exception while converting kwargs to tags: {ex}")
-        traceback.print_exc()
+        display.warning(f"encountered exception while converting kwargs to tags: {ex}")
+        debug(4, traceback.format_exc())
         return set()
 
 
@@ -66,83 +836,162 @@ def convert_kwargs_to_tags(kwargs):
 # args[0]: the tags passed as a set from some other python
 #          function
 # kwargs:  tags passed through the ansible code while
-#          calling the filter
+#          calling the filter, plus the option:
+#          return_all: scan for every rule in one pass and
+#                      return a list of {code, message, start,
+#                      end, excerpt}, empty if nothing matched
 
 def try_get_error_code(message, *args, **kwargs):
+    (options, kwargs) = split_filter_options(kwargs)
+    return_all = boolean(options.get("return_all", False))
     try:
         tags = set()
         if args:
             tags = args[0]
-        print(f"tags got from caller function = {tags}")
         tag_list = convert_kwargs_to_tags(kwargs)
         tag_list=tag_list.union(tags)
-        print(f"tag_list = {tag_list}")
-        for (matcher, op_message, valid_tags) in regex_to_error_msgs:
-            if not valid_tags:
-                valid_tags=set()
-            print(f"valid_tags = {valid_tags}")
-            if not isinstance(message, str):
-                print(f"Warning: message is not a string, got {type(message)}: {message}")
-                continue
-            if re.match(matcher, message):
-                # if the tags supplied are in the list of valid tags
-                # or the valid_tags set is empty (meaning the regex
-                # conversion is valid for all tags), return the
-                # converted message
-                if tag_list.issubset(valid_tags) or len(valid_tags) == 0:
-                    print(f"tag_list: {tag_list} is a subset of {valid_tags}")
-                    return op_message
-                else:
-                    print(f"Invalid tag list. Valid tags = {valid_tags}, "+
-                        f"supplied tag list = {tag_list}")
-            else:
-                print("regular expression could not be matched.")
+        debug(3, "try_get_error_code: tag_list = %s", tag_list)
+        if not isinstance(message, str):
+            debug(3, "try_get_error_code: message is not a string, got %s", type(message))
+            return [] if return_all else message
+        if return_all:
+            matches = classification_cache.get(
+                ClassificationCache.make_key("all", message, tag_list),
+                lambda: error_code_matcher.match_all(message, tag_list))
+            return [dict(match) for match in matches]
+        op_message = classification_cache.get(
+            ClassificationCache.make_key("first", message, tag_list),
+            lambda: error_code_matcher.match(message, tag_list))
+        if op_message is not None:
+            return op_message
+        debug(3, "try_get_error_code: no error code matched")
     except Exception as ex:
         # Handle any unexpected exceptions while processing the error
         # messages
-        print(f"Exception in try_get_error_code: {ex}")
-        traceback.print_exc()
+        display.warning(f"Exception in try_get_error_code: {ex}")
+        debug(4, traceback.format_exc())
+
+    return [] if return_all else message
 
-    return message
+# Size of the chunks a log is read and scanned in by
+# try_get_error_code_stream
+STREAM_CHUNK_SIZE = 1024 * 1024
 
-# TODO: Instead of always looking at result_obj["results"]
-#       parameterize this using tags so that other properties of the
-#       result_obj can be scanned for errors.
+# Yields the text of a log file, or of an iterable of lines, in chunks
+# of about chunk_size characters. Lines without a trailing newline
+# (e.g. stdout_lines) are joined with one, so the chunks add up to the
+# same text as the original stdout.
+def iter_text_chunks(source, chunk_size=STREAM_CHUNK_SIZE):
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8", errors="replace") as log_file:
+            while True:
+                chunk = log_file.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    pending = []
+    pending_size = 0
+    previous = None
+    for line in source:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if previous is not None and not previous.endswith("\n"):
+            pending.append("\n")
+            pending_size += 1
+        pending.append(line)
+        pending_size += len(line)
+        previous = line
+        if pending_size >= chunk_size:
+            yield "".join(pending)
+            pending = []
+            pending_size = 0
+    if pending:
+        yield "".join(pending)
+
+
+# Streaming counterpart of try_get_error_code. Returns the error coded
+# message for the contents of a log file on the controller (e.g.
+# sapinst_dev.log) or of an iterable of lines, otherwise returns the
+# source unchanged. The text is scanned chunk by chunk so memory use
+# stays constant whatever the size of the log.
+# source:  path of the log file, or an iterable of lines
+# args[0]: the tags passed as a set from some other python
+#          function
+# kwargs:  tags passed through the ansible code while
+#          calling the filter
+
+def try_get_error_code_stream(source, *args, **kwargs):
+    try:
+        tags = set()
+        if args:
+            tags = args[0]
+        tag_list = convert_kwargs_to_tags(kwargs)
+        tag_list=tag_list.union(tags)
+        debug(3, "try_get_error_code_stream: tag_list = %s", tag_list)
+        op_message = error_code_matcher.match_stream(iter_text_chunks(source), tag_list)
+        if op_message is not None:
+            return op_message
+        debug(3, "try_get_error_code_stream: no error code matched")
+    except Exception as ex:
+        display.warning(f"Exception in try_get_error_code_stream: {ex}")
+        debug(4, traceback.format_exc())
+
+    return source
 
 # Gets the error coded string from a result object whose
 # error details are present within result_obj.results[index].msg
+# All the messages are scanned in a single pass, see
+# ErrorCodeMatcher.match_batch.
 # result_obj: The object from which the erorr coded strings
 #             are to be got
 # args:       No definitions as of now
 # kwargs:     Tags passed in from ansible code while calling the
-#             filter
+#             filter, plus these options:
+#             results_key: property holding the list of results,
+#                          defaults to results
+#             message_key: property of each result holding the
+#                          message, defaults to msg
+#             return_all:  return a list of {index, code, message}
+#                          for every result with an error code,
+#                          instead of the first error coded message
 
 def try_get_error_code_results(result_obj, *args, **kwargs):
     try:
+        (options, kwargs) = split_filter_options(kwargs)
         tags = convert_kwargs_to_tags(kwargs)
-        print(f"converted kwargs to tag list {tags}")
+        debug(3, "converted kwargs to tag list %s", tags)
+        message_key = options.get("message_key", "msg")
+        return_all = boolean(options.get("return_all", False))
         # Segment doing the error handling for different task_tag s
-        results = result_obj["results"]
+        results = result_obj[options.get("results_key", "results")]
+        messages = []
         for result in results:
-            print(f'result item = {result}')
-            if not isinstance(result, dict) or "msg" not in result:
-                print(f"Warning: result is not a dict or missing 'msg' key: {result}")
+            debug(4, "result item = %s", result)
+            if not isinstance(result, dict) or message_key not in result:
+                debug(4, "result is not a dict or missing '%s' key", message_key)
+                messages.append(None)
                 continue
-            message = result["msg"]
+            message = result[message_key]
             if not isinstance(message, str):
-                print(f"Warning: message is not a string, got {type(message)}: {message}")
+                debug(4, "message is not a string, got %s", type(message))
+                messages.append(None)
                 continue
-            error_coded_message = try_get_error_code(message, tags)
-            if error_coded_message != message:
-                return error_coded_message
-            else:
-                print("Message conversion not done")
+            messages.append(message)
+        matches = classification_cache.get(
+            ClassificationCache.make_key(
+                "results_all" if return_all else "results", json.dumps(messages), tags),
+            lambda: error_code_matcher.match_batch(messages, tags, first_only=not return_all))
+        if return_all:
+            return [{"index": index, "code": get_error_code(op_message), "message": op_message}
+                    for (index, op_message) in matches]
+        if matches:
+            return matches[0][1]
     except Exception as ex:
         # This handling some unforeseen errors caused due to
         # indexing into dictionary. No special handling is
         # required as we shall pass back the object unconverted.
-        print(f"Exception in try_get_error_code_results: {ex}")
-        traceback.print_exc()
+        display.warning(f"Exception in try_get_error_code_results: {ex}")
+        debug(4, traceback.format_exc())
     return result_obj
 
 class FilterModule(object):
@@ -152,22 +1001,6 @@ class FilterModule(object):
     def filters(self):
         return {
             'try_get_error_code': try_get_error_code,
-            'try_get_error_code_results': try_get_error_code_results
+            'try_get_error_code_results': try_get_error_code_results,
+            'try_get_error_code_stream': try_get_error_code_stream
         }
-
-
-
-#-------------------------------------------------------
-# Test code that can be commented out after development
-#-------------------------------------------------------
-# result = {
-#     "results": [
-#         {
-#             "msg": "Failed to download something something"
-#         }
-#     ]
-# }
-# message = "asdConnect to message server\n<>>Make sure that the message server is started*asd\n"
-# print(try_get_error_code_results(result, task_tag="update_os_packages", host_name="host"))
-# print(try_get_error_code(message,task_tag="dbload_messageserver"))
-# convert_kwargs_to_tags(None)
@@ -12,13 +12,13 @@ DOCUMENTATION = """
         - SDAF Core Dev Team <sdaf_core_team@microsoft.com>
     version_added: 2.16
     requirements:
-        - requests
         - azure-identity
         - azure-appconfiguration
     short_description: Read configuration value from Azure App Configuration.
     description:
       - This lookup returns the content of a configuration value saved in Azure App Configuration.
       - When ansible host is MSI enabled Azure VM, user don't need provide any credential to access to Azure App Configuration.
+      - Helpers (credential and client) are cached per worker process and reused by later lookups for the same store and credentials, and all clients share one HTTP connection pool.
     options:
         _terms:
             description: Configuration key.
@@ -41,6 +41,29 @@ DOCUMENTATION = """
         timeout:
             description: Timeout (in seconds) for checking endpoint responsiveness. Default is 5.
             required: False
+        bulk:
+            description:
+              - Fetch several keys with list_configuration_settings, filtered by key and label, instead of one request per key.
+              - Each request filters on up to 5 keys, the most App Configuration accepts in one key filter.
+            type: bool
+            default: true
+            required: False
+        snapshot:
+            description:
+              - Download every setting with config_label once into a local JSON snapshot, with the ETag of each setting and the store's sync token, and answer lookups from it.
+              - Later lookups in this run and in later runs use the snapshot while it is younger than snapshot_ttl. Snapshots are kept under ANSIBLE_LOCAL_TEMP (default ~/.ansible/tmp), readable only by the current user.
+              - A snapshot that is missing any of the requested keys is downloaded again before the keys are reported as not found.
+            type: bool
+            default: false
+            required: False
+        snapshot_ttl:
+            description: Time (in seconds) a snapshot is used before it is downloaded again. Default is 3600.
+            required: False
+        sentinel_key:
+            description:
+              - Key (with config_label) that the control plane updates whenever it changes configuration. Only the sentinel is revalidated, by its ETag, on each lookup; while it is unchanged the requested keys are answered from the worker's cache or the snapshot.
+              - When the sentinel changes, every cached key with the label, or the whole snapshot, is fetched again.
+            required: False
     notes:
         - If Ansible is running on an Azure Virtual Machine with MSI enabled, client_id, client_secret and tenant_id aren't required.
         - |
@@ -70,20 +93,114 @@ RETURN = """
     description: configuration value string
 """
 
+# The Azure SDKs are imported where they are first used, to keep them out of
+# the import time of every worker that loads this plugin.
 from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.plugins.lookup import LookupBase
 from ansible.utils.display import Display
-from azure.identity import (
-    DefaultAzureCredential,
-    ClientSecretCredential,
-    ManagedIdentityCredential,
-)
-from azure.appconfiguration import AzureAppConfigurationClient
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
 import time
-import requests
 
 display = Display()
 
+# Process-wide registry of helpers, see get_helper. Maps (appconfig_url,
+# client_id, tenant_id, client secret digest) to the helper.
+_helpers = {}
+_helpers_lock = threading.Lock()
+
+# HTTP transport, and with it the connection pool, shared by the clients of
+# all helpers, see get_transport.
+_transport = None
+
+
+def _reset_helpers():
+    """
+    Drops the helpers and transport inherited from the parent process after a
+    fork. Their HTTP connections are shared with the parent and must not be
+    reused, and the lock may have been held by another thread at the time of
+    the fork.
+    """
+    global _helpers_lock, _transport
+    _helpers_lock = threading.Lock()
+    _helpers.clear()
+    _transport = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_helpers)
+
+# Most comma-separated keys App Configuration accepts in one key filter.
+KEY_FILTER_LIMIT = 5
+
+
+class SettingCache:
+    """
+    In-process cache of the ConfigurationSetting objects fetched by this
+    worker. Cached settings are revalidated with their ETag (if-none-match),
+    so an unchanged setting costs a 304 response instead of its payload.
+    """
+
+    def __init__(self):
+        self.settings = {}
+        self.stats = {"fetched": 0, "not_modified": 0, "modified": 0}
+
+    def get(self, appconfig_url, config_key, config_label=None):
+        return self.settings.get((appconfig_url, config_key, config_label))
+
+    def drop(self, appconfig_url, config_label=None):
+        """
+        Drops the settings cached for the store and label.
+        :return: The keys of the dropped settings.
+        """
+        keys = [
+            key
+            for key in self.settings
+            if key[0] == appconfig_url and key[2] == config_label
+        ]
+        for key in keys:
+            del self.settings[key]
+        return [key[1] for key in keys]
+
+    def set(self, appconfig_url, config, config_label=None):
+        self.settings[(appconfig_url, config.key, config_label)] = config
+
+    def count(self, outcome):
+        self.stats[outcome] += 1
+
+    def report(self):
+        display.v(
+            f"Configuration cache: {len(self.settings)} settings, "
+            f"{self.stats['not_modified']} not modified, "
+            f"{self.stats['modified']} modified, "
+            f"{self.stats['fetched']} fetched"
+        )
+
+
+setting_cache = SettingCache()
+
+# Directory of the configuration snapshots, see ConfigurationSnapshot.
+SNAPSHOT_DIRECTORY = os.path.join(
+    os.path.expanduser(
+        os.environ.get("ANSIBLE_LOCAL_TEMP", os.path.join("~", ".ansible", "tmp"))
+    ),
+    "azure_app_config",
+)
+
+
+def escape_filter(value):
+    """
+    Escapes the characters reserved in App Configuration key and label
+    filters (*, \\ and ,) so the value only matches itself.
+    """
+    return re.sub(r"([*\\,])", r"\\\1", value)
+
 
 class AzureAppConfigHelper:
     """
@@ -99,6 +216,7 @@ class AzureAppConfigHelper:
         client_secret=None,
         tenant_id=None,
         timeout=5,
+        transport=None,
     ):
         """
         Initialize the helper with the provided App Configuration URL and credentials.
@@ -107,10 +225,14 @@ class AzureAppConfigHelper:
         :param client_secret: Optional client secret.
         :param tenant_id: Optional tenant id.
         :param timeout: Timeout (in seconds) for responsiveness check.
+        :param transport: Optional HTTP transport to share with other clients.
         """
+        from azure.appconfiguration import AzureAppConfigurationClient
+
+        self.appconfig_url = appconfig_url
         self.credential = self.get_credential(client_id, client_secret, tenant_id)
         self.client = AzureAppConfigurationClient(
-            base_url=appconfig_url, credential=self.credential
+            base_url=appconfig_url, credential=self.credential, transport=transport
         )
         display.v(
             f"Initialized AzureAppConfigHelper with appconfig_url: {appconfig_url}"
@@ -136,6 +258,12 @@ class AzureAppConfigHelper:
         :return: An Azure credential object
         :rtype: azure.identity.DefaultAzureCredential
         """
+        from azure.identity import (
+            DefaultAzureCredential,
+            ClientSecretCredential,
+            ManagedIdentityCredential,
+        )
+
         try:
             if all([client_id, client_secret, tenant_id]):
                 display.v(
@@ -169,6 +297,8 @@ class AzureAppConfigHelper:
         :param config_label: The label (optional) for the configuration.
         :return: The value of the configuration setting.
         """
+        from azure.core import MatchConditions
+
         max_retries = 3
         retry_delay = 1  # seconds
 
@@ -180,14 +310,32 @@ class AzureAppConfigHelper:
                     f"with label: {config_label or 'None'}"
                 )
 
-                config = self.client.get_configuration_setting(
-                    key=config_key, label=config_label
-                )
+                cached = setting_cache.get(self.appconfig_url, config_key, config_label)
+                if cached:
+                    # Returns None when the setting still has the cached ETag.
+                    config = self.client.get_configuration_setting(
+                        key=config_key,
+                        label=config_label,
+                        etag=cached.etag,
+                        match_condition=MatchConditions.IfModified,
+                    )
+                    if config is None:
+                        setting_cache.count("not_modified")
+                        display.v(f"Configuration for key {config_key} not modified")
+                        return cached.value
+                    setting_cache.count("modified")
+                else:
+                    config = self.client.get_configuration_setting(
+                        key=config_key, label=config_label
+                    )
 
                 if not config:
                     display.warning(f"No configuration found for key: {config_key}")
                     return None
 
+                if not cached:
+                    setting_cache.count("fetched")
+                setting_cache.set(self.appconfig_url, config, config_label)
                 display.v(f"Successfully retrieved configuration for key: {config_key}")
                 return config.value
 
@@ -204,6 +352,310 @@ class AzureAppConfigHelper:
                         f"Failed to fetch configuration after {max_retries} attempts: {str(e)}"
                     )
 
+    def get_configurations(self, config_keys, config_label=None):
+        """
+        Retrieves several configuration settings with list_configuration_settings,
+        one paged request per KEY_FILTER_LIMIT keys instead of one per key.
+        :param config_keys: The configuration keys.
+        :param config_label: The label (optional) for the configurations.
+        :return: A dictionary of key to value for the keys found.
+        """
+        max_retries = 3
+        retry_delay = 1  # seconds
+
+        # Without a label only settings without one match, as with get_configuration.
+        label_filter = escape_filter(config_label) if config_label else "\0"
+        keys = list(dict.fromkeys(config_keys))
+        values = {}
+
+        for start in range(0, len(keys), KEY_FILTER_LIMIT):
+            chunk = keys[start : start + KEY_FILTER_LIMIT]
+            key_filter = ",".join(escape_filter(key) for key in chunk)
+            for attempt in range(max_retries):
+                try:
+                    display.v(
+                        f"Attempt {attempt + 1}/{max_retries}: "
+                        f"Fetching configuration keys: {', '.join(chunk)} "
+                        f"with label: {config_label or 'None'}"
+                    )
+
+                    for config in self.client.list_configuration_settings(
+                        key_filter=key_filter, label_filter=label_filter
+                    ):
+                        values[config.key] = config.value
+                        setting_cache.set(self.appconfig_url, config, config_label)
+                        setting_cache.count("fetched")
+                    break
+
+                except Exception as e:
+                    if attempt < max_retries - 1:
+                        display.warning(
+                            f"Attempt {attempt + 1} failed: {str(e)}. "
+                            f"Retrying in {retry_delay} seconds..."
+                        )
+                        time.sleep(retry_delay)
+                    else:
+                        display.error(
+                            f"All attempts failed for keys {', '.join(chunk)}: {str(e)}"
+                        )
+
+        display.v(f"Successfully retrieved {len(values)} of {len(keys)} configuration keys")
+        return values
+
+    def get_all_configurations(self, config_label=None):
+        """
+        Retrieves every configuration setting with the label.
+        :param config_label: The label (optional) for the configurations.
+        :return: Tuple of a dictionary of key to value and ETag, and the
+            sync token App Configuration returned with the settings.
+        """
+        max_retries = 3
+        retry_delay = 1  # seconds
+
+        label_filter = escape_filter(config_label) if config_label else "\0"
+        sync_tokens = []
+
+        for attempt in range(max_retries):
+            try:
+                display.v(
+                    f"Attempt {attempt + 1}/{max_retries}: "
+                    f"Fetching all configuration keys "
+                    f"with label: {config_label or 'None'}"
+                )
+
+                settings = {
+                    config.key: {"value": config.value, "etag": config.etag}
+                    for config in self.client.list_configuration_settings(
+                        label_filter=label_filter,
+                        raw_response_hook=lambda response: sync_tokens.append(
+                            response.http_response.headers.get("Sync-Token")
+                        ),
+                    )
+                }
+                display.v(f"Successfully retrieved {len(settings)} configuration keys")
+                return settings, next(
+                    (token for token in reversed(sync_tokens) if token), None
+                )
+
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    display.warning(
+                        f"Attempt {attempt + 1} failed: {str(e)}. "
+                        f"Retrying in {retry_delay} seconds..."
+                    )
+                    time.sleep(retry_delay)
+                else:
+                    display.error(f"All attempts failed for label {config_label}: {str(e)}")
+                    raise AnsibleError(
+                        f"Failed to fetch configuration after {max_retries} attempts: {str(e)}"
+                    )
+
+    def sentinel_changed(self, sentinel_key, config_label=None, etag=None):
+        """
+        Revalidates the sentinel key against its last known ETag.
+        :param sentinel_key: The sentinel configuration key.
+        :param config_label: The label (optional) of the sentinel.
+        :param etag: The last known ETag of the sentinel, None if unknown.
+        :return: True if the sentinel changed or could not be checked.
+        """
+        from azure.core import MatchConditions
+
+        if etag is None:
+            return True
+        try:
+            config = self.client.get_configuration_setting(
+                key=sentinel_key,
+                label=config_label,
+                etag=etag,
+                match_condition=MatchConditions.IfModified,
+            )
+        except Exception as e:
+            display.warning(f"Failed to check sentinel key {sentinel_key}: {str(e)}")
+            return True
+        if config is None:
+            setting_cache.count("not_modified")
+            display.v(f"Sentinel key {sentinel_key} not modified")
+            return False
+        setting_cache.count("modified")
+        display.v(f"Sentinel key {sentinel_key} changed, refreshing cached configuration")
+        return True
+
+    def get_sentinel_configurations(self, config_keys, sentinel_key, config_label=None):
+        """
+        Answers the keys from the setting cache while the sentinel key is
+        unchanged, fetching only the keys not cached yet. When the sentinel
+        changes, every key cached for the label is fetched again.
+        :param config_keys: The configuration keys.
+        :param sentinel_key: The sentinel configuration key.
+        :param config_label: The label (optional) for the configurations.
+        :return: A dictionary of key to value for the keys found.
+        """
+        sentinel = setting_cache.get(self.appconfig_url, sentinel_key, config_label)
+        keys = []
+        if self.sentinel_changed(
+            sentinel_key, config_label, sentinel.etag if sentinel else None
+        ):
+            # The sentinel is fetched too, to cache its new ETag.
+            keys = setting_cache.drop(self.appconfig_url, config_label) + [sentinel_key]
+        keys += [
+            key
+            for key in config_keys
+            if not setting_cache.get(self.appconfig_url, key, config_label)
+        ]
+        if keys:
+            self.get_configurations(keys, config_label)
+
+        values = {}
+        for key in config_keys:
+            config = setting_cache.get(self.appconfig_url, key, config_label)
+            if config:
+                values[key] = config.value
+        return values
+
+
+def get_transport():
+    """
+    Returns the HTTP transport shared by the clients of all helpers in this
+    process, creating it on first use. Called with _helpers_lock held.
+    """
+    global _transport
+    if _transport is None:
+        from azure.core.pipeline.transport import RequestsTransport
+
+        _transport = RequestsTransport()
+    return _transport
+
+
+def get_helper(
+    appconfig_url, client_id=None, client_secret=None, tenant_id=None, timeout=5
+):
+    """
+    Returns an AzureAppConfigHelper for the store and credentials, reusing the
+    one built by an earlier lookup in this worker. Reusing the helper keeps
+    its credential, so DefaultAzureCredential resolves its chain once, and
+    the tokens it acquired.
+    :param appconfig_url: The base URL for Azure App Configuration.
+    :param client_id: Optional client (or managed identity) ID.
+    :param client_secret: Optional client secret.
+    :param tenant_id: Optional tenant id.
+    :param timeout: Timeout (in seconds) for responsiveness check.
+    :return: An AzureAppConfigHelper instance.
+    """
+    # The secret itself is not kept in the key, only a digest of it, so that a
+    # changed secret for the same client does not reuse the old credential.
+    secret_digest = (
+        hashlib.sha256(client_secret.encode("utf-8")).hexdigest()
+        if client_secret
+        else None
+    )
+    key = (appconfig_url, client_id, tenant_id, secret_digest)
+    with _helpers_lock:
+        helper = _helpers.get(key)
+        if helper:
+            display.vvv(f"Reusing AzureAppConfigHelper for {appconfig_url}")
+            return helper
+        helper = AzureAppConfigHelper(
+            appconfig_url,
+            client_id,
+            client_secret,
+            tenant_id,
+            timeout,
+            get_transport(),
+        )
+        _helpers[key] = helper
+        return helper
+
+
+class ConfigurationSnapshot:
+    """
+    Local JSON snapshot of every setting with a label in an App Configuration
+    store. Lookups in this and later runs are answered from the snapshot while
+    it is younger than the TTL; forked workers downloading it at the same time
+    are serialised with a lock, so only one of them queries the store.
+    """
+
+    def __init__(self, appconfig_url, config_label=None):
+        self.appconfig_url = appconfig_url
+        self.config_label = config_label
+        self.created_at = None
+        self.settings = {}
+        digest = hashlib.sha256(
+            f"{appconfig_url}\n{config_label or ''}".encode("utf-8")
+        ).hexdigest()
+        self.path = os.path.join(SNAPSHOT_DIRECTORY, f"{digest}.json")
+
+    def read(self):
+        try:
+            with open(self.path, "r") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(snapshot, dict):
+            return None
+        if snapshot.get("appconfig_url") != self.appconfig_url:
+            return None
+        return snapshot
+
+    def load(self, ttl):
+        """
+        Returns the values of the snapshot if it is younger than ttl seconds,
+        None otherwise.
+        :param ttl: Time (in seconds) a snapshot is used.
+        :return: A dictionary of key to value, or None.
+        """
+        snapshot = self.read()
+        if not snapshot or time.time() - snapshot.get("created_at", 0) >= ttl:
+            return None
+        self.created_at = snapshot["created_at"]
+        self.settings = snapshot["settings"]
+        display.v(
+            f"Using configuration snapshot of {self.appconfig_url} "
+            f"with label: {self.config_label or 'None'} from {self.path}"
+        )
+        return {key: setting["value"] for key, setting in snapshot["settings"].items()}
+
+    def get_etag(self, config_key):
+        """
+        Returns the ETag the loaded snapshot recorded for the key, if any.
+        """
+        return self.settings.get(config_key, {}).get("etag")
+
+    def refresh(self, helper, ttl, stale=None):
+        """
+        Downloads the snapshot, unless another worker did while this one
+        waited for the lock, and returns its values.
+        :param helper: The AzureAppConfigHelper of the store.
+        :param ttl: Time (in seconds) a snapshot is used.
+        :param stale: Creation time of a snapshot that must not be reused,
+            because its sentinel key changed.
+        :return: A dictionary of key to value.
+        """
+        os.makedirs(SNAPSHOT_DIRECTORY, mode=0o700, exist_ok=True)
+        with open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            values = self.load(ttl)
+            if values is not None and self.created_at != stale:
+                return values
+            settings, sync_token = helper.get_all_configurations(self.config_label)
+            self.write(
+                {
+                    "appconfig_url": self.appconfig_url,
+                    "label": self.config_label,
+                    "created_at": time.time(),
+                    "sync_token": sync_token,
+                    "settings": settings,
+                }
+            )
+        display.v(f"Saved configuration snapshot to {self.path}")
+        return {key: setting["value"] for key, setting in settings.items()}
+
+    def write(self, snapshot):
+        # mkstemp creates the file readable only by the current user.
+        handle, temporary_path = tempfile.mkstemp(dir=SNAPSHOT_DIRECTORY)
+        with os.fdopen(handle, "w") as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(temporary_path, self.path)
+
 
 class LookupModule(LookupBase):
     def run(self, terms, variables, **kwargs):
@@ -222,33 +674,67 @@ class LookupModule(LookupBase):
             display.warning("Timeout value too low, setting to minimum of 1 second")
             timeout = 1
 
-        # Initialize helper with proper error handling
-        try:
-            helper = AzureAppConfigHelper(
-                appconfig_url=appconfig_url,
-                client_id=kwargs.get("client_id"),
-                client_secret=kwargs.get("client_secret"),
-                tenant_id=kwargs.get("tenant_id"),
-                timeout=timeout,
-            )
-        except Exception as e:
-            raise AnsibleError(
-                f"Failed to initialize Azure App Configuration client: {str(e)}"
-            )
-
         # Process configuration keys
         results = []
         failed_keys = []
+        values = None
+        use_snapshot = boolean(kwargs.get("snapshot", False), strict=False)
+        sentinel_key = kwargs.get("sentinel_key")
 
-        for term in terms:
-            try:
-                value = helper.get_configuration(term, config_label)
+        if use_snapshot:
+            snapshot_ttl = int(kwargs.get("snapshot_ttl", 3600))
+            snapshot = ConfigurationSnapshot(appconfig_url, config_label)
+            values = snapshot.load(snapshot_ttl)
+            helper = None
+            stale = None
+            if values is not None and sentinel_key:
+                helper = self.create_helper(kwargs, timeout)
+                if helper.sentinel_changed(
+                    sentinel_key, config_label, snapshot.get_etag(sentinel_key)
+                ):
+                    values = None
+                    stale = snapshot.created_at
+            # A key added after the snapshot was downloaded is only in the
+            # store, so a snapshot missing a requested key is downloaded again.
+            if values is not None and any(values.get(term) is None for term in terms):
+                display.v(
+                    f"Configuration snapshot {snapshot.path} is missing requested keys"
+                )
+                values = None
+                stale = snapshot.created_at
+            if values is None:
+                values = snapshot.refresh(
+                    helper or self.create_helper(kwargs, timeout), snapshot_ttl, stale
+                )
+        else:
+            helper = self.create_helper(kwargs, timeout)
+            if sentinel_key:
+                values = helper.get_sentinel_configurations(
+                    terms, sentinel_key, config_label
+                )
+            elif boolean(kwargs.get("bulk", True), strict=False) and len(terms) > 1:
+                values = helper.get_configurations(terms, config_label)
+
+        if values is not None:
+            for term in terms:
+                value = values.get(term)
                 if value is None:
                     failed_keys.append(term)
+                    display.warning(f"No configuration found for key: {term}")
                 results.append(value)
-            except Exception as e:
-                failed_keys.append(term)
-                display.error(f"Failed to fetch key {term}: {str(e)}")
+        else:
+            for term in terms:
+                try:
+                    value = helper.get_configuration(term, config_label)
+                    if value is None:
+                        failed_keys.append(term)
+                    results.append(value)
+                except Exception as e:
+                    failed_keys.append(term)
+                    display.error(f"Failed to fetch key {term}: {str(e)}")
+
+        if not use_snapshot:
+            setting_cache.report()
 
         if failed_keys:
             raise AnsibleError(
@@ -256,3 +742,18 @@ class LookupModule(LookupBase):
             )
 
         return results
+
+    def create_helper(self, kwargs, timeout):
+        # Initialize helper with proper error handling
+        try:
+            return get_helper(
+                appconfig_url=kwargs.get("appconfig_url"),
+                client_id=kwargs.get("client_id"),
+                client_secret=kwargs.get("client_secret"),
+                tenant_id=kwargs.get("tenant_id"),
+                timeout=timeout,
+            )
+        except Exception as e:
+            raise AnsibleError(
+                f"Failed to initialize Azure App Configuration client: {str(e)}"
+            )
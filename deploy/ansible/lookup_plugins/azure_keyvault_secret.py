@@ -18,9 +18,10 @@ DOCUMENTATION = """
     short_description: Read secret from Azure Key Vault with enhanced logging and robust endpoint handling.
     description:
       - This lookup returns the content of a secret saved in Azure Key Vault.
-      - The module checks for responsive endpoints on both public and private URLs using an exponential backoff retry mechanism.
+      - The module probes the private and public URLs concurrently, each with an exponential backoff retry mechanism, and uses the first one that responds.
       - Logging is integrated to provide detailed information about endpoint responsiveness, credential selection, and secret retrieval.
       - When an Ansible host is MSI-enabled on an Azure VM, credentials are not required.
+      - Helpers (credential, responsive endpoint and SecretClient) are cached per worker process and reused by later lookups for the same vault and credentials.
     options:
         _terms:
             description: Secret name. Always returns the latest version of the secret.
@@ -35,7 +36,71 @@ DOCUMENTATION = """
         tenant_id:
             description: Tenant ID of the service principal.
         timeout:
-            description: Timeout (in seconds) for endpoint responsiveness check. Default is 5.
+            description: Timeout (in seconds) for each endpoint responsiveness probe. Default is 5.
+        deadline:
+            description: Overall time (in seconds) allowed to find a responsive endpoint. Default is 30.
+        endpoint_cache_ttl:
+            description:
+              - Time (in seconds) the responsive endpoint of a vault is remembered on disk, so later lookups and playbook runs skip the probe. Default is 3600, 0 disables the cache.
+              - The cached endpoint is dropped and the vault probed again when a request cannot reach it.
+        probe_mode:
+            description:
+              - How an endpoint is checked for responsiveness.
+              - C(connect) resolves the host name and opens a TLS connection to it.
+              - C(http) sends an unauthenticated request and expects Key Vault to answer with 401.
+              - C(list) lists one secret with the credential, which needs list permission and is the slowest.
+              - When a request cannot reach the endpoint in use, the endpoints are probed again once in the same mode. HTTP errors such as 401, 403 or 404 are reported as they are.
+            choices: ['connect', 'http', 'list']
+            default: connect
+        max_workers:
+            description: Maximum number of secrets fetched concurrently when several terms are given. Default is 8, 1 fetches them one after another.
+        fail_fast:
+            description:
+              - Fail on the first secret that cannot be fetched. When false, every term is fetched and all the failed ones are reported together.
+              - Requests throttled by Key Vault (429) are retried by the Azure SDK after the delay given in its Retry-After header, at most 3 times per request.
+            type: bool
+            default: true
+        secret_cache:
+            description:
+              - Cache fetched secrets by vault, credentials and secret name/version, so the same secret looked up for many hosts is fetched once.
+              - C(none) disables the cache.
+              - C(memory) keeps values in the memory of the worker process only, which covers repeated lookups within one task, such as loops. They are not wiped explicitly, they go away with the worker process.
+              - C(shared) also stores values encrypted with a per-run key in Ansible's per-run temporary directory, so the workers running the task for other hosts reuse them. The directory is removed when the run ends.
+              - The per-run key is a Fernet key read from the SDAF_KEYVAULT_CACHE_KEY environment variable, which must be exported before ansible-playbook starts so that every worker inherits it. The key is never written to disk. Without it C(shared) behaves like C(memory).
+            choices: ['none', 'memory', 'shared']
+            default: none
+        secret_cache_ttl:
+            description: Time (in seconds) a cached secret is used before it is fetched again. Default is 300.
+        prefetch:
+            description:
+              - Treat the terms as secret name prefixes and return a single dictionary of name to value for every enabled secret matching any of them.
+              - The vault's secrets are listed once and the matching ones fetched concurrently, which needs list permission on the vault.
+            type: bool
+            default: false
+        prefetch_match:
+            description:
+              - How prefetch matches secret names against the terms.
+              - C(prefix) returns every secret whose name starts with a term, C(exact) only the secrets named by the terms, so X00-a does not also return X00-ab.
+            choices: ['prefix', 'exact']
+            default: prefix
+        credential_type:
+            description:
+              - Credential used to authenticate.
+              - C(auto) uses a service principal when client_id, client_secret and tenant_id are given, the managed identity client_id when only it is given and DefaultAzureCredential otherwise.
+              - The other choices pin the credential, so DefaultAzureCredential does not walk its chain (including the slow Azure CLI fallback) to find one.
+            choices: ['auto', 'client_secret', 'managed_identity', 'workload_identity', 'environment', 'cli', 'default']
+            default: auto
+        token_cache:
+            description:
+              - Share access tokens between all the workers of the run, encrypted with a per-run key in Ansible's per-run temporary directory, so a token is acquired once per run instead of once per task and host.
+              - Like the shared secret cache this needs the per-run key in SDAF_KEYVAULT_CACHE_KEY, without it tokens are only reused within a worker.
+              - Tokens are acquired again shortly before they expire.
+            type: bool
+            default: false
+        timing_log:
+            description:
+              - Path of a JSON lines file the duration of every phase of the lookup is appended to, one object per credential creation, token acquisition, endpoint resolution and probe, secret request and endpoint refresh.
+              - Defaults to the SDAF_KEYVAULT_TIMING_LOG environment variable. A per-phase summary is always displayed with -v.
     notes:
         - If version is not provided, this plugin returns the latest version of the secret.
         - When Ansible is running on an Azure Virtual Machine with MSI enabled, client_id, client_secret and tenant_id aren't required.
@@ -56,33 +121,489 @@ EXAMPLES = """
     client_secret: 'abcdefg'
     tenant_id: 'uvwxyz'
   debug: msg="The secret value is {{ lookup('azure_keyvault_secret', secretname, vault_url=url, client_id=client_id, client_secret=client_secret, tenant_id=tenant_id) }}"
+
+- name: Prefetch all secrets of a SID in one lookup
+  set_fact:
+    sid_secrets: "{{ lookup('azure_keyvault_secret', sap_sid ~ '-', vault_url='https://yourvault.vault.azure.net', prefetch=true) }}"
 """
 
 RETURN = """
   _raw:
-    description: The secret content string.
+    description: The secret content string, or a dictionary of secret name to content with prefetch.
 """
 
+# The Azure SDKs, requests and cryptography are imported where they are first
+# used: Ansible loads this plugin in every worker that templates a lookup, and
+# importing them up front dominated the plugin's import time.
+from ansible import constants as C
 from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.plugins.lookup import LookupBase
 from ansible.utils.display import Display
-from azure.identity import (
-    DefaultAzureCredential,
-    ClientSecretCredential,
-    ManagedIdentityCredential,
-)
-from azure.keyvault.secrets import SecretClient
-from azure.core.exceptions import HttpResponseError
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import contextvars
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import ssl
+import tempfile
+import threading
 import time
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Records only go where the controller's logging configuration sends them,
+# display already reports every step at -v.
 logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
 display = Display()
 
+# Seconds a cached AzureKeyVaultHelper is reused before it is rebuilt,
+# which re-checks which endpoint of the vault is responsive.
+HELPER_TTL = 900
+
+# Process-wide registry of helpers, see get_helper. Maps the helper key
+# (see get_helper_key) and endpoint settings (timeout, deadline,
+# endpoint_cache_ttl, probe_mode) to (helper, creation time), and each such
+# key to the lock held while its helper is built. _helpers_lock only guards the two dictionaries.
+_helpers = {}
+_helper_locks = {}
+_helpers_lock = threading.Lock()
+
+
+def _reset_helpers():
+    """
+    Drops the helpers inherited from the parent process after a fork. Their
+    HTTP connections are shared with the parent and must not be reused, and
+    the locks may have been held by other threads at the time of the fork.
+    """
+    global _helpers_lock
+    _helpers_lock = threading.Lock()
+    _helpers.clear()
+    _helper_locks.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_helpers)
+
+
+class LookupTimings:
+    """
+    Collects the duration of each phase of one lookup: credential creation,
+    token acquisition, endpoint resolution and probes, secret requests and
+    endpoint refreshes.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, phase, vault_url, name=None, **details):
+        """
+        Records the duration of the block as a phase. The record is yielded
+        so that the block can set its outcome, which otherwise is ok, or the
+        status code or exception type if the block raises.
+        """
+        record = dict(
+            time=time.time(), pid=os.getpid(), phase=phase, vault=vault_url, name=name
+        )
+        record.update(details)
+        started = time.monotonic()
+        try:
+            yield record
+        except Exception as e:
+            record["outcome"] = getattr(e, "status_code", None) or type(e).__name__
+            raise
+        finally:
+            record["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+            record.setdefault("outcome", "ok")
+            with self.lock:
+                self.records.append(record)
+
+    def drain(self):
+        with self.lock:
+            records, self.records = self.records, []
+        return records
+
+    def report(self, records, path=None):
+        """
+        Displays a per-phase summary of the records and appends them to the
+        JSON lines file at path, if given.
+        """
+        phases = {}
+        for record in records:
+            phases.setdefault(record["phase"], []).append(record["elapsed_ms"])
+        if phases:
+            summary = ", ".join(
+                f"{phase} {len(elapsed)}x {sum(elapsed):.1f}ms (max {max(elapsed):.1f}ms)"
+                for phase, elapsed in phases.items()
+            )
+            display.v(f"Key Vault lookup timings: {summary}")
+            logger.info(f"Key Vault lookup timings: {summary}")
+        if not path or not records:
+            return
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        try:
+            # A single append keeps the lines of concurrent workers intact.
+            handle = os.open(
+                os.path.expanduser(path), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600
+            )
+            try:
+                os.write(handle, lines.encode("utf-8"))
+            finally:
+                os.close(handle)
+        except OSError as e:
+            display.warning(f"Could not write Key Vault lookup timings to {path}: {e}")
+            logger.warning(f"Could not write Key Vault lookup timings to {path}: {e}")
+
+
+# Collector of the lookup running in the current context, see measure.
+# LookupModule.run sets its own and the threads it starts run in a copy of
+# its context, so concurrent lookups never see each other's records.
+current_timings = contextvars.ContextVar("current_timings", default=None)
+
+
+@contextmanager
+def measure(phase, vault_url, name=None, **details):
+    """
+    Records the duration of the block in the collector of the current
+    lookup, see LookupTimings.measure. Outside of a lookup the record is
+    discarded.
+    """
+    collector = current_timings.get()
+    if collector is None:
+        yield {}
+        return
+    with collector.measure(phase, vault_url, name, **details) as record:
+        yield record
+
+
+PROBE_MODES = ("connect", "http", "list")
+
+PREFETCH_MATCHES = ("prefix", "exact")
+
+# Key Vault API version used by the unauthenticated http probe.
+PROBE_API_VERSION = "7.4"
+
+# Times the SecretClient's retry policy retries a request, e.g. one
+# throttled by Key Vault (429) after the delay in its Retry-After header.
+# The SDK default of 10 multiplies the load on a vault that is already
+# throttling by the number of concurrent workers.
+REQUEST_RETRIES = 3
+
+
+def is_connection_error(error):
+    """
+    Returns whether the request failed because the endpoint could not be
+    reached, as opposed to an HTTP error returned by Key Vault.
+    :param error: The exception raised by the request.
+    :return: True for connection and transport errors.
+    """
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+
+    return isinstance(error, (ServiceRequestError, ServiceResponseError))
+
+
+# File remembering the responsive endpoint of each vault, see EndpointCache.
+ENDPOINT_CACHE_PATH = os.path.join(
+    os.path.expanduser(
+        os.environ.get("ANSIBLE_LOCAL_TEMP", os.path.join("~", ".ansible", "tmp"))
+    ),
+    "azure_keyvault_endpoints.json",
+)
+
+
+class EndpointCache:
+    """
+    Remembers on disk which endpoint (private or public) of each vault
+    responded, so later lookups and playbook runs on this controller can skip
+    the probe. The cache is best effort: any error reading or writing it is
+    logged and otherwise ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as cache_file:
+                entries = json.load(cache_file)
+            return entries if isinstance(entries, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _update(self, change):
+        """
+        Applies change to the cached entries while holding an exclusive lock,
+        so concurrent workers do not lose each other's updates, and replaces
+        the file atomically.
+        """
+        try:
+            directory = os.path.dirname(self.path)
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            with open(self.path + ".lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                entries = self._read()
+                change(entries)
+                handle, temporary_path = tempfile.mkstemp(dir=directory)
+                with os.fdopen(handle, "w") as cache_file:
+                    json.dump(entries, cache_file)
+                os.replace(temporary_path, self.path)
+        except OSError as e:
+            display.vvv(f"Could not update endpoint cache {self.path}: {e}")
+            logger.debug(f"Could not update endpoint cache {self.path}: {e}")
+
+    def get(self, vault_url, ttl):
+        """
+        Returns the endpoint cached for the vault if it is younger than ttl
+        seconds, None otherwise.
+        """
+        if ttl <= 0:
+            return None
+        entry = self._read().get(vault_url)
+        if not isinstance(entry, dict):
+            return None
+        if time.time() - entry.get("resolved_at", 0) >= ttl:
+            return None
+        return entry.get("url")
+
+    def set(self, vault_url, url):
+        self._update(
+            lambda entries: entries.update(
+                {vault_url: {"url": url, "resolved_at": time.time()}}
+            )
+        )
+
+    def invalidate(self, vault_url):
+        self._update(lambda entries: entries.pop(vault_url, None))
+
+
+endpoint_cache = EndpointCache(ENDPOINT_CACHE_PATH)
+
+SECRET_CACHE_MODES = ("none", "memory", "shared")
+
+# Environment variable holding the Fernet key the shared caches are
+# encrypted with, e.g. the output of Fernet.generate_key(). It is exported
+# before ansible-playbook starts, so the forked workers inherit it and it is
+# never stored next to the values it protects.
+SHARED_CACHE_KEY_VARIABLE = "SDAF_KEYVAULT_CACHE_KEY"
+
+
+class SecretCache:
+    """
+    Opt-in cache of secret values keyed by a scope, such as the vault and
+    the credentials they were fetched with, and a name.
+
+    Values are kept in the memory of this process. In shared mode they are
+    also written, encrypted with the per-run key in SHARED_CACHE_KEY_VARIABLE,
+    to Ansible's per-run temporary directory, which the controller removes
+    when the run ends, so that the forked workers running a task for other
+    hosts reuse them. Without the key shared mode falls back to memory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.fernet = None
+
+    def get(self, scope, name, ttl, shared=False):
+        """
+        Returns the cached value of the name in scope if it is younger than
+        ttl seconds, None otherwise.
+        """
+        key = (scope, name)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry and time.monotonic() - entry[1] < ttl:
+            return entry[0]
+        fernet = self.get_fernet() if shared else None
+        if not fernet:
+            return None
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self.get_path(key), "rb") as cache_file:
+                token = cache_file.read()
+            # Fernet tokens carry their creation time, which enforces the TTL.
+            value = fernet.decrypt(token, ttl=ttl).decode("utf-8")
+        except (OSError, InvalidToken):
+            return None
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+        return value
+
+    def set(self, scope, name, value, shared=False):
+        key = (scope, name)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+        fernet = self.get_fernet() if shared else None
+        if not fernet:
+            return
+        try:
+            token = fernet.encrypt(value.encode("utf-8"))
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            handle, temporary_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(handle, "wb") as cache_file:
+                cache_file.write(token)
+            os.replace(temporary_path, self.get_path(key))
+        except OSError as e:
+            display.vvv(f"Could not share cached value {name}: {e}")
+            logger.debug(f"Could not share cached value {name}: {e}")
+
+    def get_path(self, key):
+        # File names are digests so that secret names are not exposed either.
+        digest = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def get_fernet(self):
+        """
+        Returns the Fernet instance for the per-run key in
+        SHARED_CACHE_KEY_VARIABLE, or None if the variable is not set.
+        Raises AnsibleError if it does not hold a valid key.
+        """
+        if self.fernet is not None:
+            return self.fernet or None
+        from cryptography.fernet import Fernet
+
+        key = os.environ.get(SHARED_CACHE_KEY_VARIABLE)
+        if not key:
+            self.fernet = False
+            # Reported once per worker, so only at -vvv to not flood the output.
+            display.vvv(
+                f"{SHARED_CACHE_KEY_VARIABLE} is not set, cached values are not shared between workers"
+            )
+            logger.debug(
+                f"{SHARED_CACHE_KEY_VARIABLE} is not set, cached values are not shared between workers"
+            )
+            return None
+        try:
+            self.fernet = Fernet(key)
+        except (TypeError, ValueError) as e:
+            raise AnsibleError(f"Invalid key in {SHARED_CACHE_KEY_VARIABLE}: {e}")
+        return self.fernet
+
+
+# Values in memory last as long as the worker process, Ansible ends workers
+# with os._exit, so there is no exit hook to clear them. The shared files are
+# removed with the per-run temporary directory by the controller.
+secret_cache = SecretCache(os.path.join(C.DEFAULT_LOCAL_TMP, "azure_keyvault_secrets"))
+
+CREDENTIAL_TYPES = (
+    "auto",
+    "client_secret",
+    "managed_identity",
+    "workload_identity",
+    "environment",
+    "cli",
+    "default",
+)
+
+# Cached access tokens are acquired again this long (in seconds) before they
+# expire, and the encrypted store is trusted for at most TOKEN_CACHE_TTL.
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_CACHE_TTL = 86400
+
+token_cache = SecretCache(os.path.join(C.DEFAULT_LOCAL_TMP, "azure_keyvault_tokens"))
+
+
+def get_secret_digest(client_secret):
+    """
+    Returns a digest of the client secret, used in cache keys so that the
+    secret itself is not kept and a changed secret is not matched.
+    """
+    if not client_secret:
+        return None
+    return hashlib.sha256(client_secret.encode("utf-8")).hexdigest()
+
+
+def get_helper_key(
+    vault_url,
+    client_id=None,
+    client_secret=None,
+    tenant_id=None,
+    credential_type="auto",
+    token_cache=False,
+):
+    """
+    Returns the key of the helper for the vault and credentials, which
+    scopes the secrets it fetched in secret_cache, so a lookup is never
+    served a value fetched with another identity. get_helper also keys its
+    registry by the endpoint settings, which do not change the values.
+    """
+    return (
+        vault_url,
+        client_id,
+        tenant_id,
+        get_secret_digest(client_secret),
+        credential_type,
+        token_cache,
+    )
+
+
+class CachedTokenCredential:
+    """
+    Wraps a credential so that its access tokens are shared through
+    token_cache by every worker of the run.
+    """
+
+    def __init__(self, credential, cache_key):
+        self.credential = credential
+        self.cache_key = cache_key
+
+    def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+
+        # Tokens requested for a claims challenge must not come from the cache.
+        if kwargs.get("claims"):
+            return self.credential.get_token(*scopes, **kwargs)
+        # CAE and non-CAE tokens for the same scopes must not replace each other.
+        token_key = "\n".join(
+            scopes
+            + (kwargs.get("tenant_id") or "", str(bool(kwargs.get("enable_cae"))))
+        )
+        cached = token_cache.get(self.cache_key, token_key, TOKEN_CACHE_TTL, True)
+        if cached:
+            token, expires_on = json.loads(cached)
+            if expires_on - TOKEN_REFRESH_MARGIN > time.time():
+                display.vvv(f"Using cached access token for {', '.join(scopes)}")
+                logger.debug(f"Using cached access token for {', '.join(scopes)}")
+                return AccessToken(token, expires_on)
+        access_token = self.credential.get_token(*scopes, **kwargs)
+        token_cache.set(
+            self.cache_key,
+            token_key,
+            json.dumps([access_token.token, access_token.expires_on]),
+            True,
+        )
+        return access_token
+
+    def close(self):
+        self.credential.close()
+
+
+class TimedCredential:
+    """
+    Wraps a credential to record the time spent acquiring access tokens.
+    """
+
+    def __init__(self, credential, vault_url):
+        self.credential = credential
+        self.vault_url = vault_url
+
+    def get_token(self, *scopes, **kwargs):
+        with measure("token", self.vault_url):
+            return self.credential.get_token(*scopes, **kwargs)
+
+    def close(self):
+        self.credential.close()
+
 
 class AzureKeyVaultHelper:
     """
@@ -92,7 +613,17 @@ class AzureKeyVaultHelper:
     """
 
     def __init__(
-        self, vault_url, client_id=None, client_secret=None, tenant_id=None, timeout=5
+        self,
+        vault_url,
+        client_id=None,
+        client_secret=None,
+        tenant_id=None,
+        timeout=5,
+        deadline=30,
+        endpoint_cache_ttl=3600,
+        probe_mode="connect",
+        credential_type="auto",
+        token_cache=False,
     ):
         """
         Initialize the helper with the provided Key Vault URL and credentials.
@@ -100,74 +631,304 @@ class AzureKeyVaultHelper:
         :param client_id: Optional client (or managed identity) ID.
         :param client_secret: Optional client secret.
         :param tenant_id: Optional tenant ID.
-        :param timeout: Timeout (in seconds) for checking endpoint responsiveness.
+        :param timeout: Timeout (in seconds) for each endpoint probe.
+        :param deadline: Overall time (in seconds) to find a responsive endpoint.
+        :param endpoint_cache_ttl: Time (in seconds) a resolved endpoint is cached on disk.
+        :param probe_mode: How endpoints are probed, one of PROBE_MODES.
+        :param credential_type: The credential to use, one of CREDENTIAL_TYPES.
+        :param token_cache: Share access tokens between the workers of the run.
         """
+        self.base_url = vault_url
+        self.key = get_helper_key(
+            vault_url, client_id, client_secret, tenant_id, credential_type, token_cache
+        )
+        self.timeout = timeout
+        self.deadline = deadline
+        self.endpoint_cache_ttl = endpoint_cache_ttl
+        self.probe_mode = probe_mode
+        # Serialises endpoint re-resolution between concurrent get_secret calls.
+        self.lock = threading.Lock()
+        with measure("credential", vault_url):
+            self.credential = self.get_credential(
+                client_id, client_secret, tenant_id, credential_type
+            )
+        self.credential_name = type(self.credential).__name__
+        if token_cache:
+            self.credential = CachedTokenCredential(
+                self.credential,
+                "\n".join(
+                    [
+                        type(self.credential).__name__,
+                        client_id or "",
+                        tenant_id or "",
+                        get_secret_digest(client_secret) or "",
+                    ]
+                ),
+            )
+        self.credential = TimedCredential(self.credential, vault_url)
         # Determine and cache the responsive URL.
-        self.credential = self.get_credential(client_id, client_secret, tenant_id)
-        self.vault_url = self.get_responsive_url(vault_url, timeout)
-        self.client = SecretClient(vault_url=self.vault_url, credential=self.credential)
+        self.vault_url = self.resolve_url()
+        self.client = self.create_client(self.vault_url)
         display.v(f"Initialized AzureKeyVaultHelper with vault_url: {self.vault_url}")
         logger.info(f"Initialized AzureKeyVaultHelper with vault_url: {self.vault_url}")
 
-    def get_responsive_url(self, vault_url, timeout=5):
+    def resolve_url(self):
+        """
+        Returns the endpoint cached on disk for the vault if there is a fresh
+        one, otherwise probes the endpoints and caches the responsive one.
+        :return: A responsive URL string.
         """
-        Tests both public and private endpoints using SecretClient to validate connectivity.
+        with measure("resolve", self.base_url, mode=self.probe_mode) as record:
+            url = endpoint_cache.get(self.base_url, self.endpoint_cache_ttl)
+            if url:
+                record["outcome"] = "cached"
+                display.v(f"Using cached responsive URL: {url}")
+                logger.info(f"Using cached responsive URL: {url}")
+                return url
+            url = self.get_responsive_url(
+                self.base_url, self.timeout, self.deadline, self.probe_mode
+            )
+        if self.endpoint_cache_ttl > 0:
+            endpoint_cache.set(self.base_url, url)
+        return url
+
+    def create_client(self, vault_url, **kwargs):
+        """
+        Returns a SecretClient for the endpoint using the helper's credential.
+        :param vault_url: The endpoint URL.
+        :param kwargs: Additional SecretClient (transport) options.
+        :return: A SecretClient instance.
+        """
+        from azure.keyvault.secrets import SecretClient
+
+        kwargs.setdefault("retry_total", REQUEST_RETRIES)
+        return SecretClient(vault_url=vault_url, credential=self.credential, **kwargs)
+
+    def refresh_url(self, failed_client):
+        """
+        Drops the cached endpoint of the vault, probes the endpoints again
+        and rebuilds the client for the responsive one.
+        :param failed_client: The client a request failed through. Nothing is
+            done if another thread already replaced it.
+        """
+        with self.lock:
+            if self.client is not failed_client:
+                return
+            endpoint_cache.invalidate(self.base_url)
+            self.vault_url = self.get_responsive_url(
+                self.base_url, self.timeout, self.deadline, self.probe_mode
+            )
+            if self.endpoint_cache_ttl > 0:
+                endpoint_cache.set(self.base_url, self.vault_url)
+            self.client = self.create_client(self.vault_url)
+
+    def retry_after_refresh(self, failed_client, error, name=None):
+        """
+        Probes the endpoints again after a request through failed_client
+        could not reach its endpoint, which may be stale. HTTP errors come
+        from the vault itself and say nothing about the endpoint.
+        :param failed_client: The client the request failed through.
+        :param error: The exception raised by the request.
+        :param name: The secret the request was for, if any.
+        :return: True if the endpoints were probed again and the request
+            should be retried, False if error should be reported.
+        """
+        if not is_connection_error(error):
+            return False
+        display.v(f"Could not reach URL {self.vault_url}, probing the endpoints again")
+        logger.warning(
+            f"Could not reach URL {self.vault_url}, probing the endpoints again"
+        )
+        try:
+            with measure("refresh", self.base_url, name):
+                self.refresh_url(failed_client)
+        except AnsibleError as e:
+            display.v(f"Probing the endpoints of {self.base_url} failed: {e}")
+            logger.error(f"Probing the endpoints of {self.base_url} failed: {e}")
+            return False
+        return True
+
+    def get_responsive_url(
+        self, vault_url, timeout=5, deadline=30, probe_mode="connect"
+    ):
+        """
+        Probes the private and public endpoints concurrently and returns the
+        first one that responds. The other probe is cancelled once a winner
+        is found, so hosts without private DNS no longer wait for all the
+        private endpoint retries before the public one is tried.
         :param vault_url: Base URL for Azure Key Vault.
-        :param timeout: Timeout (in seconds) for endpoint responsiveness.
+        :param timeout: Timeout (in seconds) for each probe.
+        :param deadline: Overall time (in seconds) to find a responsive endpoint.
+        :param probe_mode: How endpoints are probed, one of PROBE_MODES.
         :return: A responsive URL string.
         """
         public_url = vault_url
         private_url = vault_url.replace(
             ".vault.azure.net", ".privatelink.vault.azure.net"
         )
-
-        for url in [private_url, public_url]:
-            attempts = 3
-            delay = 1
-            for attempt in range(attempts):
-                try:
-                    # Create a SecretClient for the given URL using the existing credential.
-                    client = SecretClient(vault_url=url, credential=self.credential)
-                    # Perform a lightweight operation: try listing secret properties.
-                    # We only need to iterate over one value.
-                    _ = next(client.list_properties_of_secrets(), None)
+        expires_at = time.monotonic() + deadline
+        cancelled = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=2)
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                self.probe_url,
+                url,
+                timeout,
+                expires_at,
+                cancelled,
+                probe_mode,
+            ): url
+            for url in [private_url, public_url]
+        }
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                if future.result():
+                    url = futures[future]
                     display.v(f"Using responsive URL: {url}")
                     logger.info(f"Using responsive URL: {url}")
                     return url
-                except HttpResponseError as e:
-                    display.v(
-                        f"Attempt {attempt + 1}: URL {url} returned an HTTP error: {e}"
-                    )
-                    logger.warning(
-                        f"Attempt {attempt + 1}: URL {url} returned an HTTP error: {e}"
-                    )
-                except Exception as e:
-                    display.v(f"Attempt {attempt + 1}: URL {url} not responsive: {e}")
-                    logger.error(
-                        f"Attempt {attempt + 1}: URL {url} not responsive: {e}"
-                    )
-                time.sleep(delay)
-                delay *= 2  # exponential backoff
+        except FuturesTimeoutError:
+            display.v(f"No endpoint of {vault_url} responded within {deadline}s")
+            logger.error(f"No endpoint of {vault_url} responded within {deadline}s")
+        finally:
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
 
         raise AnsibleError(
             "Failed to connect to both public and private endpoints of Azure Key Vault."
         )
 
-    def get_credential(self, client_id, client_secret, tenant_id):
+    def probe_url(self, url, timeout, expires_at, cancelled, probe_mode="connect"):
+        """
+        Checks whether the endpoint responds, retrying with exponential backoff
+        until it does, the deadline passes or the probe is cancelled.
+        :param url: The endpoint URL to probe.
+        :param timeout: Timeout (in seconds) for each attempt.
+        :param expires_at: time.monotonic() value after which to give up.
+        :param cancelled: threading.Event set when the probe is no longer needed.
+        :param probe_mode: How the endpoint is probed, one of PROBE_MODES.
+        :return: True if the endpoint responded, False otherwise.
+        """
+        from azure.core.exceptions import HttpResponseError
+
+        if probe_mode == "list":
+            # Retries are handled here, so the SDK's own retry policy is disabled.
+            client = self.create_client(
+                url,
+                connection_timeout=timeout,
+                read_timeout=timeout,
+                retry_total=0,
+            )
+        delay = 1
+        attempt = 0
+        while not cancelled.is_set():
+            attempt += 1
+            try:
+                with measure("probe", url, mode=probe_mode, attempt=attempt):
+                    if probe_mode == "connect":
+                        self.connect_url(url, timeout)
+                    elif probe_mode == "http":
+                        self.request_url(url, timeout)
+                    else:
+                        # List secret properties, only one value is needed.
+                        _ = next(client.list_properties_of_secrets(), None)
+                return True
+            except HttpResponseError as e:
+                display.v(f"Attempt {attempt}: URL {url} returned an HTTP error: {e}")
+                logger.warning(
+                    f"Attempt {attempt}: URL {url} returned an HTTP error: {e}"
+                )
+            except Exception as e:
+                display.v(f"Attempt {attempt}: URL {url} not responsive: {e}")
+                logger.error(f"Attempt {attempt}: URL {url} not responsive: {e}")
+            if time.monotonic() + delay >= expires_at:
+                break
+            cancelled.wait(delay)
+            delay *= 2  # exponential backoff
+        return False
+
+    def connect_url(self, url, timeout):
+        """
+        Resolves the host of the endpoint and opens a TLS connection to it,
+        without sending a request. Raises an exception if either step fails.
+        :param url: The endpoint URL to probe.
+        :param timeout: Timeout (in seconds) for the connection.
+        """
+        parts = urlsplit(url)
+        host = parts.hostname
+        context = ssl.create_default_context()
+        address = (host, parts.port or 443)
+        with socket.create_connection(address, timeout=timeout) as sock:
+            with context.wrap_socket(sock, server_hostname=host):
+                pass
+
+    def request_url(self, url, timeout):
+        """
+        Sends an unauthenticated request to the endpoint, which Key Vault
+        answers with 401 and an authentication challenge. Raises an exception
+        if the request fails or the endpoint answers with anything else.
+        :param url: The endpoint URL to probe.
+        :param timeout: Timeout (in seconds) for the request.
+        """
+        import requests
+
+        response = requests.get(
+            f"{url.rstrip('/')}/secrets",
+            params={"api-version": PROBE_API_VERSION, "maxresults": 1},
+            timeout=timeout,
+        )
+        if response.status_code != 401:
+            raise Exception(f"Unexpected status code {response.status_code}")
+
+    def get_credential(
+        self, client_id, client_secret, tenant_id, credential_type="auto"
+    ):
         """
         Returns the appropriate credential based on provided parameters.
+        :param credential_type: The credential to use, one of CREDENTIAL_TYPES.
+            auto picks one from the parameters given.
         :return: An Azure credential object.
         """
-        if client_id and client_secret and tenant_id:
+        from azure.identity import (
+            AzureCliCredential,
+            DefaultAzureCredential,
+            ClientSecretCredential,
+            EnvironmentCredential,
+            ManagedIdentityCredential,
+            WorkloadIdentityCredential,
+        )
+
+        if credential_type == "auto":
+            if client_id and client_secret and tenant_id:
+                credential_type = "client_secret"
+            elif client_id:
+                credential_type = "managed_identity"
+            else:
+                credential_type = "default"
+
+        if credential_type == "client_secret":
             display.v("Using ClientSecretCredential for authentication")
             logger.info("Using ClientSecretCredential for authentication")
             return ClientSecretCredential(
                 client_id=client_id, client_secret=client_secret, tenant_id=tenant_id
             )
-        elif client_id:
+        elif credential_type == "managed_identity":
             display.v("Using ManagedIdentityCredential for authentication")
             logger.info("Using ManagedIdentityCredential for authentication")
             return ManagedIdentityCredential(client_id=client_id)
+        elif credential_type == "workload_identity":
+            display.v("Using WorkloadIdentityCredential for authentication")
+            logger.info("Using WorkloadIdentityCredential for authentication")
+            return WorkloadIdentityCredential(tenant_id=tenant_id, client_id=client_id)
+        elif credential_type == "environment":
+            display.v("Using EnvironmentCredential for authentication")
+            logger.info("Using EnvironmentCredential for authentication")
+            return EnvironmentCredential()
+        elif credential_type == "cli":
+            display.v("Using AzureCliCredential for authentication")
+            logger.info("Using AzureCliCredential for authentication")
+            return AzureCliCredential(tenant_id=tenant_id or "")
         else:
             display.v("Using DefaultAzureCredential for authentication")
             logger.info("Using DefaultAzureCredential for authentication")
@@ -175,29 +936,217 @@ class AzureKeyVaultHelper:
 
     def get_secret(self, secret_name):
         """
-        Retrieves the secret from Azure Key Vault.
+        Retrieves the secret from Azure Key Vault. Throttled requests are
+        retried by the client's retry policy, see REQUEST_RETRIES.
         :param secret_name: The secret name (optionally with version, e.g., secret_name/version).
         :return: The secret value.
         """
+        attempt = 0
+        refreshed = False
+        while True:
+            client = self.client
+            attempt += 1
+            try:
+                display.v(
+                    f"Fetching secret: {secret_name} from {self.vault_url} using {self.credential_name}"
+                )
+                logger.info(
+                    f"Fetching secret: {secret_name} from {self.vault_url} using {self.credential_name}"
+                )
+                with measure(
+                    "get_secret", self.base_url, secret_name, attempt=attempt
+                ):
+                    secret = client.get_secret(secret_name)
+                display.v(f"Successfully fetched secret: {secret_name}")
+                logger.info(f"Successfully fetched secret: {secret_name}")
+                return secret.value
+            except Exception as e:
+                # The endpoints are probed again at most once per secret, if the
+                # probe fails the original error is reported.
+                if not refreshed and self.retry_after_refresh(client, e, secret_name):
+                    refreshed = True
+                    continue
+                display.error(
+                    f"Failed to fetch secret {secret_name} from {self.vault_url}. Error: {str(e)}"
+                )
+                logger.error(
+                    f"Failed to fetch secret {secret_name} from {self.vault_url}. Error: {str(e)}"
+                )
+                raise AnsibleError(f"Failed to fetch secret {secret_name}: {str(e)}")
+
+    def list_secret_names(self, prefixes, match="prefix"):
+        """
+        Lists the vault's secrets once and returns the names of the enabled
+        ones starting with any of the prefixes.
+        :param prefixes: The secret name prefixes.
+        :param match: One of PREFETCH_MATCHES, exact only returns the names
+            equal to one of the prefixes.
+        :return: The sorted matching secret names.
+        """
+
+        def matches(name):
+            if match == "exact":
+                return name in prefixes
+            return any(name.startswith(p) for p in prefixes)
+
+        refreshed = False
+        while True:
+            client = self.client
+            try:
+                display.v(f"Listing secrets in {self.vault_url}")
+                logger.info(f"Listing secrets in {self.vault_url}")
+                with measure("list", self.base_url):
+                    names = [
+                        properties.name
+                        for properties in client.list_properties_of_secrets()
+                        if properties.enabled is not False
+                        and matches(properties.name)
+                    ]
+                display.v(f"Found {len(names)} secrets matching {', '.join(prefixes)}")
+                logger.info(f"Found {len(names)} secrets matching {', '.join(prefixes)}")
+                return sorted(names)
+            except Exception as e:
+                # See get_secret.
+                if not refreshed and self.retry_after_refresh(client, e):
+                    refreshed = True
+                    continue
+                display.error(f"Failed to list secrets in {self.vault_url}. Error: {str(e)}")
+                logger.error(f"Failed to list secrets in {self.vault_url}. Error: {str(e)}")
+                raise AnsibleError(f"Failed to list secrets: {str(e)}")
+
+    def get_secrets(self, secret_names, max_workers=8, fail_fast=True):
+        """
+        Retrieves several secrets concurrently with a bounded thread pool.
+        :param secret_names: The secret names (optionally with versions).
+        :param max_workers: Maximum number of secrets fetched at the same time.
+        :param fail_fast: Raise on the first failure instead of fetching the
+            remaining secrets and reporting every failure at the end.
+        :return: The secret values, in the order of secret_names.
+        """
+        if len(secret_names) <= 1 or max_workers <= 1:
+            return [self.get_secret(secret_name) for secret_name in secret_names]
+
+        values = [None] * len(secret_names)
+        failed = []
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(secret_names)))
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run, self.get_secret, secret_name
+            ): index
+            for index, secret_name in enumerate(secret_names)
+        }
         try:
-            display.v(
-                f"Fetching secret: {secret_name} from {self.vault_url} using {type(self.credential).__name__}"
-            )
-            logger.info(
-                f"Fetching secret: {secret_name} from {self.vault_url} using {type(self.credential).__name__}"
-            )
-            secret = self.client.get_secret(secret_name)
-            display.v(f"Successfully fetched secret: {secret_name}")
-            logger.info(f"Successfully fetched secret: {secret_name}")
-            return secret.value
-        except Exception as e:
-            display.error(
-                f"Failed to fetch secret {secret_name} from {self.vault_url}. Error: {str(e)}"
-            )
-            logger.error(
-                f"Failed to fetch secret {secret_name} from {self.vault_url}. Error: {str(e)}"
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    values[index] = future.result()
+                except AnsibleError:
+                    if fail_fast:
+                        raise
+                    failed.append(index)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if failed:
+            failed_secrets = [str(secret_names[index]) for index in sorted(failed)]
+            raise AnsibleError(
+                f"Failed to fetch the following secrets: {', '.join(failed_secrets)}"
             )
-            raise AnsibleError(f"Failed to fetch secret {secret_name}: {str(e)}")
+        return values
+
+
+def get_cached_secrets(
+    helper, secret_names, ttl, shared=False, max_workers=8, fail_fast=True
+):
+    """
+    Returns the secret values from the secret cache, fetching and caching
+    the ones that are missing or expired.
+    :param helper: The AzureKeyVaultHelper of the vault.
+    :param secret_names: The secret names (optionally with versions).
+    :param ttl: Time (in seconds) a cached secret is used.
+    :param shared: Share the cache between forked workers, see SecretCache.
+    :param max_workers: Maximum number of secrets fetched at the same time.
+    :param fail_fast: Raise on the first failure, see get_secrets.
+    :return: The secret values, in the order of secret_names.
+    """
+    values = {}
+    for secret_name in secret_names:
+        value = secret_cache.get(helper.key, secret_name, ttl, shared)
+        if value is not None:
+            values[secret_name] = value
+    display.vvv(f"Secret cache: {len(values)} of {len(secret_names)} secrets cached")
+    logger.debug(f"Secret cache: {len(values)} of {len(secret_names)} secrets cached")
+
+    missing = list(dict.fromkeys(name for name in secret_names if name not in values))
+    for secret_name, value in zip(
+        missing, helper.get_secrets(missing, max_workers, fail_fast)
+    ):
+        secret_cache.set(helper.key, secret_name, value, shared)
+        values[secret_name] = value
+    return [values[secret_name] for secret_name in secret_names]
+
+
+def get_helper(
+    vault_url,
+    client_id=None,
+    client_secret=None,
+    tenant_id=None,
+    timeout=5,
+    deadline=30,
+    endpoint_cache_ttl=3600,
+    probe_mode="connect",
+    credential_type="auto",
+    token_cache=False,
+):
+    """
+    Returns an AzureKeyVaultHelper for the vault and credentials, reusing the
+    one built by an earlier lookup in this process if it is younger than
+    HELPER_TTL. Reusing the helper keeps its authenticated credential,
+    resolved endpoint and the SecretClient's HTTP connection pool.
+    :param vault_url: The base URL for Azure Key Vault.
+    :param client_id: Optional client (or managed identity) ID.
+    :param client_secret: Optional client secret.
+    :param tenant_id: Optional tenant ID.
+    :param timeout: Timeout (in seconds) for each endpoint probe.
+    :param deadline: Overall time (in seconds) to find a responsive endpoint.
+    :param endpoint_cache_ttl: Time (in seconds) a resolved endpoint is cached on disk.
+    :param probe_mode: How endpoints are probed, one of PROBE_MODES.
+    :param credential_type: The credential to use, one of CREDENTIAL_TYPES.
+    :param token_cache: Share access tokens between the workers of the run.
+    :return: An AzureKeyVaultHelper instance.
+    """
+    # A lookup with other endpoint settings gets its own helper, rather than
+    # one that probes and caches endpoints with the settings of another.
+    key = get_helper_key(
+        vault_url, client_id, client_secret, tenant_id, credential_type, token_cache
+    ) + (timeout, deadline, endpoint_cache_ttl, probe_mode)
+    with _helpers_lock:
+        helper_lock = _helper_locks.setdefault(key, threading.Lock())
+    # Built while holding the lock of the key, so that concurrent lookups for
+    # the same vault and credentials wait for one helper instead of probing
+    # in parallel, while lookups for other keys are not blocked.
+    with helper_lock:
+        with _helpers_lock:
+            entry = _helpers.get(key)
+        if entry and time.monotonic() - entry[1] < HELPER_TTL:
+            display.vvv(f"Reusing AzureKeyVaultHelper for {vault_url}")
+            logger.debug(f"Reusing AzureKeyVaultHelper for {vault_url}")
+            return entry[0]
+        helper = AzureKeyVaultHelper(
+            vault_url,
+            client_id,
+            client_secret,
+            tenant_id,
+            timeout,
+            deadline,
+            endpoint_cache_ttl,
+            probe_mode,
+            credential_type,
+            token_cache,
+        )
+        with _helpers_lock:
+            _helpers[key] = (helper, time.monotonic())
+        return helper
 
 
 class LookupModule(LookupBase):
@@ -210,26 +1159,95 @@ class LookupModule(LookupBase):
         client_id = kwargs.get("client_id")
         client_secret = kwargs.get("client_secret")
         tenant_id = kwargs.get("tenant_id")
-        timeout = kwargs.get("timeout", 5)  # Allow configuring a custom timeout
+        timeout = int(kwargs.get("timeout", 5))  # Allow configuring a custom timeout
+        deadline = int(kwargs.get("deadline", 30))
+        endpoint_cache_ttl = int(kwargs.get("endpoint_cache_ttl", 3600))
+        probe_mode = kwargs.get("probe_mode", "connect")
+        max_workers = int(kwargs.get("max_workers", 8))
+        fail_fast = boolean(kwargs.get("fail_fast", True), strict=False)
+        secret_cache_mode = kwargs.get("secret_cache", "none")
+        secret_cache_ttl = int(kwargs.get("secret_cache_ttl", 300))
+        prefetch = boolean(kwargs.get("prefetch", False), strict=False)
+        prefetch_match = kwargs.get("prefetch_match", "prefix")
+        credential_type = kwargs.get("credential_type", "auto")
+        token_cache = boolean(kwargs.get("token_cache", False), strict=False)
+        timing_log = kwargs.get(
+            "timing_log", os.environ.get("SDAF_KEYVAULT_TIMING_LOG")
+        )
 
         if not vault_url:
             display.error("Failed to get a valid vault url.")
             logger.error("Failed to get a valid vault url.")
             raise AnsibleError("Failed to get a valid vault url.")
 
-        # Initialize the helper with the provided timeout value.
-        helper = AzureKeyVaultHelper(
-            vault_url, client_id, client_secret, tenant_id, timeout
-        )
-        ret = []
+        if probe_mode not in PROBE_MODES:
+            raise AnsibleError(
+                f"Invalid probe_mode {probe_mode}, expected one of: {', '.join(PROBE_MODES)}"
+            )
+
+        if prefetch_match not in PREFETCH_MATCHES:
+            raise AnsibleError(
+                f"Invalid prefetch_match {prefetch_match}, expected one of: {', '.join(PREFETCH_MATCHES)}"
+            )
 
-        for term in terms:
+        if secret_cache_mode not in SECRET_CACHE_MODES:
+            raise AnsibleError(
+                f"Invalid secret_cache {secret_cache_mode}, expected one of: {', '.join(SECRET_CACHE_MODES)}"
+            )
+
+        if credential_type not in CREDENTIAL_TYPES:
+            raise AnsibleError(
+                f"Invalid credential_type {credential_type}, expected one of: {', '.join(CREDENTIAL_TYPES)}"
+            )
+
+        if credential_type == "client_secret" and not (
+            client_id and client_secret and tenant_id
+        ):
+            raise AnsibleError(
+                "credential_type client_secret requires client_id, client_secret and tenant_id."
+            )
+
+        timings = LookupTimings()
+        timings_token = current_timings.set(timings)
+        try:
+            # Get a (possibly cached) helper with the provided timeout values.
+            helper = get_helper(
+                vault_url,
+                client_id,
+                client_secret,
+                tenant_id,
+                timeout,
+                deadline,
+                endpoint_cache_ttl,
+                probe_mode,
+                credential_type,
+                token_cache,
+            )
             try:
-                secret_value = helper.get_secret(term)
-                ret.append(secret_value)
+                secret_names = (
+                    helper.list_secret_names(terms, prefetch_match)
+                    if prefetch
+                    else terms
+                )
+                if secret_cache_mode == "none":
+                    ret = helper.get_secrets(secret_names, max_workers, fail_fast)
+                else:
+                    ret = get_cached_secrets(
+                        helper,
+                        secret_names,
+                        secret_cache_ttl,
+                        secret_cache_mode == "shared",
+                        max_workers,
+                        fail_fast,
+                    )
+                if prefetch:
+                    ret = [dict(zip(secret_names, ret))]
             except AnsibleError as e:
                 display.error(str(e))
                 logger.error(str(e))
                 raise
+        finally:
+            current_timings.reset(timings_token)
+            timings.report(timings.drain(), timing_log)
 
         return ret
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Regression checks and benchmark for the error code filters in
+deploy/ansible/filter_plugins/custom_filters.py.
+
+validate checks the catalogue format and every pattern, check runs the
+golden table (error_code_golden.yaml, next to this script) through each
+filter, worst-case times every rule against large messages it must not
+match and benchmark measures load time, throughput and worst case
+latency. Each command exits with a non-zero status on failure, so they
+can gate a build.
+
+    python deploy/scripts/py_scripts/check_error_codes.py validate [<catalogue>]
+    python deploy/scripts/py_scripts/check_error_codes.py check [<catalogue>] [--golden PATH]
+    python deploy/scripts/py_scripts/check_error_codes.py worst-case [<catalogue>] [--sizes 1M,50M]
+    python deploy/scripts/py_scripts/check_error_codes.py benchmark [<catalogue>] [--sizes 1K,1M,50M]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+FILTER_PLUGIN = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "..",
+        "ansible",
+        "filter_plugins",
+        "custom_filters.py",
+    )
+)
+
+# Golden table of messages and the error code they must get.
+GOLDEN_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "error_code_golden.yaml"
+)
+
+# Maximum seconds a rule may take to reject a worst case message.
+DEFAULT_BUDGET = 1.0
+
+
+def load_filters():
+    """
+    Imports the filter plugin from the repository.
+    :return: The custom_filters module.
+    """
+    spec = importlib.util.spec_from_file_location("custom_filters", FILTER_PLUGIN)
+    filters = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(filters)
+    return filters
+
+
+def load_golden_cases(path=GOLDEN_PATH):
+    """
+    Loads the golden table.
+    :param path: Path of the golden table.
+    :return: List of (name, message, tags, code) tuples, code being None for
+        messages that must not be converted.
+    """
+    import yaml
+
+    with open(path, "r") as golden_file:
+        data = yaml.safe_load(golden_file)
+    return [
+        (case["name"], case["message"], set(case.get("tags") or []), case.get("code"))
+        for case in data["cases"]
+    ]
+
+
+def check_golden_cases(filters, cases):
+    """
+    Runs every golden case through each of the filters and prints the
+    results that differ from the expected code.
+    :param filters: The custom_filters module.
+    :param cases: The golden cases, see load_golden_cases.
+    :return: The number of failures.
+    """
+    failures = 0
+    for name, message, tags, code in cases:
+        kwargs = dict(tag.split("=", 1) for tag in tags)
+        filters.classification_cache.entries.clear()
+        matches = filters.try_get_error_code(message, return_all=True, **kwargs)
+        results = {
+            "try_get_error_code": filters.try_get_error_code(message, **kwargs),
+            "try_get_error_code(return_all)": matches[0]["message"]
+            if matches
+            else message,
+            "try_get_error_code_results": filters.try_get_error_code_results(
+                {"results": [{"msg": "ok"}, {"rc": 1}, {"msg": message}]}, **kwargs
+            ),
+            "try_get_error_code_stream": filters.try_get_error_code_stream(
+                message.splitlines(), **kwargs
+            ),
+        }
+        for filter_name, result in results.items():
+            result_code = None
+            if isinstance(result, str) and result != message:
+                result_code = filters.get_error_code(result)
+            if result_code != code:
+                failures += 1
+                print(
+                    f"FAIL {name}: {filter_name} returned {result_code}, expected {code}"
+                )
+    print(f"{len(cases)} golden cases, {failures} failures")
+    return failures
+
+
+def parse_size(size):
+    """
+    Parses a size such as 1K, 1M or 50M into a number of bytes.
+    """
+    units = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    size = size.strip().upper()
+    if size[-1:] in units:
+        return int(size[:-1]) * units[size[-1]]
+    return int(size)
+
+
+def build_corpus(cases, size):
+    """
+    Returns the messages of the golden cases repeated until they add up to
+    size bytes. Only the messages that must not be converted are used, so
+    the whole corpus is scanned.
+    """
+    messages = [message for (_, message, _, code) in cases if code is None]
+    corpus = []
+    total = 0
+    while total < size:
+        message = messages[len(corpus) % len(messages)]
+        corpus.append(message[: size - total])
+        total += len(corpus[-1])
+    return corpus
+
+
+def time_filter(filters, function, repeat=3):
+    """
+    Returns the slowest and fastest of repeated timings of function(), with
+    the classification cache cleared before each call.
+    """
+    timings = []
+    for _ in range(repeat):
+        filters.classification_cache.entries.clear()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return (max(timings), min(timings))
+
+
+# Fillers of the worst case messages: short lines, one long line for rules
+# that only look at the first line of a message, and, as None, one long line
+# repeating the fixed text of the rule but its last piece, which gives a
+# backtracking regex the most ways to split the message.
+WORST_CASE_FILLERS = [
+    ("lines", "sapinst: step completed without errors\n"),
+    ("single line", "sapinst: step completed without errors "),
+    ("repeated fixed text", None),
+]
+
+
+def time_rule(rule, message, connection):
+    """
+    Sends the time rule.search(message) takes, and whether it matched,
+    through connection. Runs in a child process, see time_worst_case.
+    """
+    started = time.perf_counter()
+    matched = rule.search(message) is not None
+    connection.send((time.perf_counter() - started, matched))
+
+
+def time_worst_case(rule, message, budget):
+    """
+    Times rule.search(message) in a forked process, which is killed once it
+    runs for longer than the budget, so that a backtracking rule fails the
+    check instead of stalling it.
+    :return: Tuple of the elapsed seconds, None if the search was killed,
+        and whether the rule matched.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=time_rule, args=(rule, message, sender))
+    process.start()
+    sender.close()
+    try:
+        if receiver.poll(budget + 1):
+            return receiver.recv()
+        return (None, False)
+    finally:
+        process.kill()
+        process.join()
+        receiver.close()
+
+
+def check_worst_case_timing(matcher, size, filler, budget):
+    """
+    Runs every rule against a large synthetic message that contains all but
+    the last piece of fixed text the rule needs, which is the worst case for
+    a backtracking regex.
+    :param matcher: The ErrorCodeMatcher to check.
+    :param size: Size of the messages in bytes.
+    :param filler: Text the messages are padded with, None to repeat the
+        fixed text of each rule but its last piece.
+    :param budget: Maximum seconds per evaluation.
+    :return: The slowest evaluation in seconds, or None if any of the
+        messages was matched or an evaluation was killed.
+    """
+    slowest = 0.0
+    for rule in matcher.rules:
+        text = filler or " ".join(rule.literals[:-1]) + " "
+        if not text.strip():
+            text = WORST_CASE_FILLERS[1][1]
+        padding = text * (size // len(text) // 2 + 1)
+        message = padding + " ".join(rule.literals[:-1]) + padding
+        (elapsed, matched) = time_worst_case(rule, message, budget)
+        if elapsed is None:
+            print(f"FAIL {rule.code} still running after {budget + 1:g}s")
+            return None
+        if matched:
+            print(f"FAIL {rule.code} matched a message missing '{rule.literals[-1]}'")
+            return None
+        slowest = max(slowest, elapsed)
+    return slowest
+
+
+def check_worst_cases(matcher, sizes, budget):
+    """
+    Runs check_worst_case_timing for each size and filler and prints the
+    slowest evaluation.
+    :return: True if every size stayed within the budget.
+    """
+    passed = True
+    for size in sizes:
+        for name, filler in WORST_CASE_FILLERS:
+            slowest = check_worst_case_timing(matcher, size, filler, budget)
+            if slowest is None:
+                passed = False
+                continue
+            status = "ok" if slowest <= budget else f"FAIL over budget of {budget:g}s"
+            passed = passed and slowest <= budget
+            label = f"worst case rule, {name}"
+            print(f"{size:>10} {label:<40} {slowest:>9.4f}s  {status}")
+    return passed
+
+
+def benchmark(filters, cases, sizes):
+    """
+    Prints the throughput of try_get_error_code and
+    try_get_error_code_results on corpora of each size.
+    """
+    matching = [(message, tags) for (_, message, tags, code) in cases if code][0]
+    print(f"{'size':>10} {'filter':<40} {'worst':>10} {'best':>10} {'MB/s':>8}")
+    for size in sizes:
+        corpus = build_corpus(cases, size)
+        message = "".join(corpus)
+        items = {"results": [{"msg": item} for item in corpus] + [{"msg": matching[0]}]}
+        kwargs = dict(tag.split("=", 1) for tag in matching[1])
+        benchmarks = [
+            ("try_get_error_code, no match", lambda: filters.try_get_error_code(message)),
+            (
+                "try_get_error_code, match at the end",
+                lambda: filters.try_get_error_code(message + matching[0], **kwargs),
+            ),
+            (
+                f"try_get_error_code_results, {len(corpus)} items",
+                lambda: filters.try_get_error_code_results(items, **kwargs),
+            ),
+        ]
+        for name, function in benchmarks:
+            (worst, best) = time_filter(filters, function)
+            print(
+                f"{size:>10} {name:<40} {worst:>9.4f}s {best:>9.4f}s "
+                f"{size / max(best, 1e-9) / 1024 / 1024:>8.1f}"
+            )
+
+
+def main(argv=None):
+    filters = load_filters()
+    parser = argparse.ArgumentParser(
+        description="Validate, check and benchmark an error code catalogue."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    validate_parser = subparsers.add_parser(
+        "validate", help="check the catalogue format and every pattern"
+    )
+    check_parser = subparsers.add_parser(
+        "check", help="check the filters against the golden table"
+    )
+    check_parser.add_argument("--golden", default=GOLDEN_PATH)
+    worst_case_parser = subparsers.add_parser(
+        "worst-case", help="time every rule against messages it must not match"
+    )
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="measure load time, throughput and worst case latency"
+    )
+    benchmark_parser.add_argument("--golden", default=GOLDEN_PATH)
+    for subparser, sizes in [
+        (worst_case_parser, "1M,50M"),
+        (benchmark_parser, "1K,1M,50M"),
+    ]:
+        subparser.add_argument(
+            "--sizes",
+            default=sizes,
+            help=f"comma separated sizes of the messages (default {sizes})",
+        )
+        subparser.add_argument(
+            "--budget",
+            type=float,
+            default=DEFAULT_BUDGET,
+            help=f"maximum seconds per worst case evaluation (default {DEFAULT_BUDGET:g})",
+        )
+    for subparser in [validate_parser, check_parser, worst_case_parser, benchmark_parser]:
+        subparser.add_argument("catalogue", nargs="?", default=filters.CATALOGUE_PATH)
+    args = parser.parse_args(argv)
+
+    with open(args.catalogue, "rb") as catalogue_file:
+        content = catalogue_file.read()
+    started = time.perf_counter()
+    try:
+        catalogue = filters.parse_catalogue(content, args.catalogue)
+    except ValueError as ex:
+        print(f"error: {ex}")
+        return 1
+    parsed = time.perf_counter()
+    errors = []
+    rules = filters.compile_catalogue(catalogue, errors)
+    compiled = time.perf_counter()
+    for error in errors:
+        print(f"error: {error}")
+    if args.command == "validate":
+        print(f"{args.catalogue}: {len(rules)} rules valid, {len(errors)} rejected")
+        return 1 if errors else 0
+
+    # The filters below use the catalogue given on the command line.
+    filters.error_code_matcher = filters.ErrorCodeMatcher(rules)
+    sizes = [parse_size(size) for size in getattr(args, "sizes", "").split(",") if size]
+    if args.command == "check":
+        failures = check_golden_cases(filters, load_golden_cases(args.golden))
+        return 1 if failures or errors else 0
+    if args.command == "worst-case":
+        passed = check_worst_cases(filters.error_code_matcher, sizes, args.budget)
+        return 0 if passed and not errors else 1
+
+    cached = json.dumps({"rules": [rule.to_dict() for rule in rules]})
+    cache_started = time.perf_counter()
+    [filters.ErrorCodeRule.from_dict(rule) for rule in json.loads(cached)["rules"]]
+    cache_loaded = time.perf_counter()
+    print(
+        f"parse: {parsed - started:.4f}s, compile: {compiled - parsed:.4f}s, "
+        f"load from cache: {cache_loaded - cache_started:.4f}s"
+    )
+    benchmark(filters, load_golden_cases(args.golden), sizes)
+    passed = check_worst_cases(filters.error_code_matcher, sizes, args.budget)
+    return 0 if passed and not errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Regression checks for the caching and batching of the SDAF Ansible lookup
+plugins (azure_app_config and azure_keyvault_secret).
+
+Each check runs the plugin's LookupModule against in-memory fakes of the
+Azure SDK clients and credentials, so no Azure access is needed, only the
+Azure SDK packages the plugins import. Exits with a non-zero status when a
+check fails, so it can gate a build.
+
+    python deploy/scripts/py_scripts/check_lookup_plugins.py
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+LOOKUP_PLUGINS = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "..",
+        "ansible",
+        "lookup_plugins",
+    )
+)
+
+
+def load_plugin(name):
+    """
+    Imports a lookup plugin from the repository.
+    :param name: File name of the plugin, without .py.
+    :return: The plugin module.
+    """
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(LOOKUP_PLUGINS, f"{name}.py")
+    )
+    plugin = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(plugin)
+    return plugin
+
+
+class FakeCredential:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+
+        return AccessToken("token", int(time.time()) + 3600)
+
+    def close(self):
+        pass
+
+
+class FakeClientSecretCredential(FakeCredential):
+    pass
+
+
+class FakeSetting:
+    def __init__(self, key, value, label, etag):
+        self.key = key
+        self.value = value
+        self.label = label
+        self.etag = etag
+
+
+class FakeAppConfigurationClient:
+    """
+    App Configuration client answering from STORE, a dictionary of
+    (key, label) to (value, etag), and recording each request in requests.
+    """
+
+    STORE = {}
+    requests = []
+
+    def __init__(self, base_url=None, credential=None, **kwargs):
+        pass
+
+    def get_configuration_setting(
+        self, key, label=None, etag=None, match_condition=None, **kwargs
+    ):
+        from azure.core import MatchConditions
+
+        self.requests.append(("get", key))
+        if (key, label) not in self.STORE:
+            return None
+        value, current = self.STORE[(key, label)]
+        if match_condition == MatchConditions.IfModified and etag == current:
+            return None
+        return FakeSetting(key, value, label, current)
+
+    def list_configuration_settings(self, key_filter=None, label_filter=None, **kwargs):
+        self.requests.append(("list", key_filter))
+        keys = [key.replace("\\", "") for key in key_filter.split(",")]
+        label = None if label_filter == "\0" else label_filter
+        return iter(
+            [
+                FakeSetting(key, value, label, etag)
+                for (key, setting_label), (value, etag) in self.STORE.items()
+                if key in keys and setting_label == label
+            ]
+        )
+
+
+class FakeSecretClient:
+    """
+    Key Vault client returning the name of the credential type it was built
+    with and the secret name as the value, and recording each request in
+    requests.
+    """
+
+    requests = []
+
+    def __init__(self, vault_url, credential, **kwargs):
+        self.credential = credential
+
+    def get_secret(self, name, version=None, **kwargs):
+        self.requests.append(name)
+        credential_name = type(self.credential.credential).__name__
+
+        class Secret:
+            value = f"{credential_name}:{name}"
+
+        return Secret()
+
+
+def check(name, condition, details=""):
+    """
+    Prints the outcome of a check.
+    :return: 0 if condition holds, 1 otherwise.
+    """
+    status = "ok" if condition else "FAIL"
+    print(f"{status} {name}: {details}" if details else f"{status} {name}")
+    return 0 if condition else 1
+
+
+def check_bulk_order(app_config):
+    """
+    Bulk lookups return the values in term order, across key filter chunks,
+    and report the keys that are missing.
+    """
+    failures = 0
+    url = "https://bulk.azconfig.io"
+    keys = [f"key{index}" for index in range(8)]
+    FakeAppConfigurationClient.STORE = {
+        (key, "L"): (f"value-{key}", "e1") for key in keys
+    }
+    terms = list(reversed(keys))
+    values = app_config.LookupModule().run(
+        terms, None, appconfig_url=url, config_label="L"
+    )
+    failures += check(
+        "bulk results are in term order",
+        values == [f"value-{key}" for key in terms],
+        str(values),
+    )
+    lists = [r for r in FakeAppConfigurationClient.requests if r[0] == "list"]
+    failures += check(
+        "bulk results are fetched with one list request per key filter chunk",
+        len(lists) == 2,
+        str(lists),
+    )
+    try:
+        app_config.LookupModule().run(
+            ["key1", "missing", "key0"], None, appconfig_url=url, config_label="L"
+        )
+        failures += check("missing keys are reported", False, "no error raised")
+    except app_config.AnsibleError as e:
+        failures += check(
+            "missing keys are reported",
+            "missing" in str(e) and "key0" not in str(e),
+            str(e),
+        )
+    return failures
+
+
+def check_sentinel(app_config):
+    """
+    An unchanged sentinel is only revalidated, a changed one refetches the
+    keys cached for the label.
+    """
+    failures = 0
+    url = "https://sentinel.azconfig.io"
+    store = {
+        ("a", "L"): ("1", "a1"),
+        ("b", "L"): ("2", "b1"),
+        ("sentinel", "L"): ("s", "s1"),
+    }
+    FakeAppConfigurationClient.STORE = store
+    lookup = app_config.LookupModule()
+    kwargs = dict(appconfig_url=url, config_label="L", sentinel_key="sentinel")
+    lookup.run(["a", "b"], None, **kwargs)
+
+    FakeAppConfigurationClient.requests.clear()
+    values = lookup.run(["a", "b"], None, **kwargs)
+    failures += check(
+        "an unchanged sentinel makes no fetch",
+        values == ["1", "2"]
+        and FakeAppConfigurationClient.requests == [("get", "sentinel")],
+        str(FakeAppConfigurationClient.requests),
+    )
+
+    store[("a", "L")] = ("3", "a2")
+    store[("sentinel", "L")] = ("s", "s2")
+    FakeAppConfigurationClient.requests.clear()
+    values = lookup.run(["a", "b"], None, **kwargs)
+    lists = [r for r in FakeAppConfigurationClient.requests if r[0] == "list"]
+    failures += check(
+        "a changed sentinel refetches the label",
+        values == ["3", "2"]
+        and len(lists) == 1
+        and "a" in lists[0][1].split(","),
+        f"{values} {FakeAppConfigurationClient.requests}",
+    )
+    return failures
+
+
+def check_secret_cache_scope(keyvault):
+    """
+    The secret cache never serves a value fetched with one helper key to a
+    lookup with another.
+    """
+    failures = 0
+    url = "https://scope.vault.azure.net"
+    lookup = keyvault.LookupModule()
+    service_principal = dict(
+        client_id="client", client_secret="secret", tenant_id="tenant"
+    )
+    default = lookup.run(["sid-sshkey"], None, vault_url=url, secret_cache="memory")
+    explicit = lookup.run(
+        ["sid-sshkey"], None, vault_url=url, secret_cache="memory", **service_principal
+    )
+    failures += check(
+        "secrets are cached per helper key",
+        default != explicit and len(FakeSecretClient.requests) == 2,
+        f"{default} {explicit}",
+    )
+    FakeSecretClient.requests.clear()
+    again = lookup.run(["sid-sshkey"], None, vault_url=url, secret_cache="memory")
+    failures += check(
+        "cached secrets are served to the same helper key",
+        again == default and not FakeSecretClient.requests,
+        str(again),
+    )
+    return failures
+
+
+def main():
+    # The plugins keep their caches under ANSIBLE_LOCAL_TEMP.
+    os.environ["ANSIBLE_LOCAL_TEMP"] = tempfile.mkdtemp()
+    app_config = load_plugin("azure_app_config")
+    keyvault = load_plugin("azure_keyvault_secret")
+
+    failures = 0
+    with mock.patch(
+        "azure.appconfiguration.AzureAppConfigurationClient", FakeAppConfigurationClient
+    ), mock.patch(
+        "azure.keyvault.secrets.SecretClient", FakeSecretClient
+    ), mock.patch(
+        "azure.identity.DefaultAzureCredential", FakeCredential
+    ), mock.patch(
+        "azure.identity.ClientSecretCredential", FakeClientSecretCredential
+    ), mock.patch.object(
+        keyvault.AzureKeyVaultHelper, "connect_url", lambda self, url, timeout: None
+    ):
+        failures += check_bulk_order(app_config)
+        failures += check_sentinel(app_config)
+        failures += check_secret_cache_scope(keyvault)
+    print(f"{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Import-time benchmark for the SDAF Ansible lookup plugins.
+
+Ansible imports a lookup plugin in every worker process that templates it,
+so the plugins defer the Azure SDK, requests and cryptography imports to
+first use. This script imports each plugin in a fresh interpreter, after the
+Ansible modules a worker has already loaded, and fails when a plugin takes
+longer than the budget or pulls one of the deferred modules in at import.
+
+    python deploy/scripts/py_scripts/check_plugin_import_time.py
+    python deploy/scripts/py_scripts/check_plugin_import_time.py --budget 50 --runs 10
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LOOKUP_PLUGINS = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "..",
+        "ansible",
+        "lookup_plugins",
+    )
+)
+
+# Modules the plugins must only import on first use.
+DEFERRED_MODULES = ("azure", "requests", "cryptography")
+
+# Import budget (in milliseconds) per plugin, on top of the Ansible baseline.
+DEFAULT_BUDGET = 100
+
+# Run in a fresh interpreter: imports what an Ansible worker has already
+# loaded, then times importing the plugin and reports the deferred modules
+# that were imported with it.
+PROBE = """
+import importlib.util, json, sys, time
+import ansible.constants, ansible.errors, ansible.plugins.lookup
+import ansible.module_utils.parsing.convert_bool, ansible.utils.display
+before = set(sys.modules)
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("plugin", sys.argv[1])
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+elapsed = (time.perf_counter() - started) * 1000
+loaded = {name.split(".")[0] for name in set(sys.modules) - before}
+deferred = sorted(loaded & set(sys.argv[2].split(",")))
+print(json.dumps({"elapsed": elapsed, "deferred": deferred}))
+"""
+
+
+def measure(path, runs):
+    """
+    Imports the plugin runs times, each in a fresh interpreter.
+    :param path: Path of the plugin file.
+    :param runs: Number of imports to time.
+    :return: Tuple of the median import time in milliseconds and the deferred
+        modules imported with the plugin.
+    """
+    timings = []
+    deferred = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, path, ",".join(DEFERRED_MODULES)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["elapsed"])
+        deferred.update(result["deferred"])
+    return statistics.median(timings), sorted(deferred)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the import time of the SDAF Ansible lookup plugins."
+    )
+    parser.add_argument(
+        "plugins",
+        nargs="*",
+        help="Plugin files to check, all lookup plugins by default",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=DEFAULT_BUDGET,
+        help=f"Import budget in milliseconds per plugin (default {DEFAULT_BUDGET})",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Imports to time per plugin, the median is reported (default 5)",
+    )
+    args = parser.parse_args(argv)
+
+    plugins = args.plugins or sorted(glob.glob(os.path.join(LOOKUP_PLUGINS, "*.py")))
+    failed = False
+    for path in plugins:
+        elapsed, deferred = measure(path, args.runs)
+        status = "ok"
+        if deferred:
+            status = f"FAIL imports {', '.join(deferred)}"
+        elif elapsed > args.budget:
+            status = f"FAIL over budget of {args.budget:g} ms"
+        failed = failed or status != "ok"
+        print(f"{os.path.basename(path):<32} {elapsed:8.1f} ms  {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())